@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import TelegramMessage
+
+
+@admin.register(TelegramMessage)
+class TelegramMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'chat_id', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['text']
+    readonly_fields = ['chat_id', 'text', 'attempts', 'last_error', 'created_at', 'sent_at']
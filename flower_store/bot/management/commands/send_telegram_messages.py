@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bot.outbox import DeliveryStats, deliver_pending, make_session
+
+
+class Command(BaseCommand):
+    help = 'Отправляет сообщения из outbox в Telegram'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между опросами пустой очереди, сек.')
+        parser.add_argument('--once', action='store_true', help='Отправить текущую очередь и выйти')
+
+    def handle(self, *args, **options):
+        session = make_session(options['concurrency'])
+        total = DeliveryStats()
+
+        try:
+            while True:
+                stats = deliver_pending(session, options['batch_size'], options['concurrency'])
+                total.merge(stats)
+                if stats.latencies:
+                    self.stdout.write(
+                        f"sent={stats.sent} retried={stats.retried} failed={stats.failed} "
+                        f"rate_limited={stats.rate_limited} avg_latency_ms={stats.avg_latency_ms}"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            session.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Всего: sent={total.sent} retried={total.retried} failed={total.failed} "
+            f"rate_limited={total.rate_limited} avg_latency_ms={total.avg_latency_ms}"
+        ))
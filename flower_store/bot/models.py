@@ -1,3 +1,55 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class TelegramMessage(models.Model):
+    class MessageStatus(models.TextChoices):
+        PENDING = 'pending', 'Ожидает отправки'
+        SENT = 'sent', 'Отправлено'
+        FAILED = 'failed', 'Не доставлено'
+
+    chat_id = models.CharField(
+        max_length=64,
+        verbose_name='Чат'
+    )
+    text = models.TextField(
+        verbose_name='Текст сообщения'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=MessageStatus.choices,
+        default=MessageStatus.PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Попыток отправки'
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Следующая попытка'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата создания'
+    )
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата отправки'
+    )
+
+    class Meta:
+        verbose_name = 'Сообщение в Telegram'
+        verbose_name_plural = 'Очередь сообщений в Telegram'
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='bot_outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'Сообщение #{self.id} ({self.status})'
@@ -1,17 +1,76 @@
+from collections import defaultdict
+
 import requests
 from django.conf import settings
 
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+from core.metrics import track
+
+from .models import TelegramMessage
+
+TELEGRAM_TIMEOUT = (3.05, 10)
+# Максимальная длина текста sendMessage: длинное сообщение Telegram отклоняет с 400
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def get_telegram_api_url() -> str:
+    return f"{settings.TELEGRAM_API_BASE_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+
+
+def enqueue_telegram_message(chat_id: str, text: str) -> TelegramMessage:
+    """Кладёт сообщение в outbox; отправляет его команда send_telegram_messages"""
+    return TelegramMessage.objects.create(chat_id=chat_id, text=text)
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """Делит текст на части не длиннее limit по границам строк; строка длиннее limit режется по символам"""
+    chunks, lines, size = [], [], 0
+    for line in text.split('\n'):
+        for piece in [line[start:start + limit] for start in range(0, len(line), limit)] or ['']:
+            if lines and size + 1 + len(piece) > limit:
+                chunks.append('\n'.join(lines))
+                lines = []
+            size = size + 1 + len(piece) if lines else len(piece)
+            lines.append(piece)
+    chunks.append('\n'.join(lines))
+    return [chunk.strip('\n') for chunk in chunks if chunk.strip()]
+
+
+def enqueue_long_message(chat_id: str, text: str) -> list[TelegramMessage]:
+    """Кладёт в outbox текст любой длины: по сообщению на каждую часть из split_message"""
+    return [enqueue_telegram_message(chat_id, chunk) for chunk in split_message(text)]
+
+
+def format_order_for_courier(order) -> str:
+    return (
+        f"Адрес: {order.delivery_address}\n"
+        f"Дата: {order.delivery_date}, {order.get_delivery_time_display()}\n"
+        f"Получатель: {order.customer_name}, {order.customer_phone}\n"
+        f"Товар: {order.product} × {order.quantity}\n"
+        f"Сумма: {order.total_price} ₽"
+    )
+
+
+def enqueue_courier_digests(orders):
+    """Одно сообщение на курьера со всеми его заказами вместо сообщения на каждый заказ"""
+    by_courier = defaultdict(list)
+    for order in orders:
+        by_courier[order.courier].append(order)
+
+    for courier, courier_orders in by_courier.items():
+        text = (
+            f"🚚 Новые заказы для доставки: {len(courier_orders)}\n\n"
+            f"Курьер: {courier.name}\n\n"
+            + "\n\n".join(format_order_for_courier(order) for order in courier_orders)
+        )
+        enqueue_long_message(settings.TELEGRAM_GROUP_CHAT_ID, text)
 
 
-def send_telegram_message(chat_id: str, text: str):
+def send_telegram_message(chat_id: str, text: str, session: requests.Session = None) -> requests.Response:
+    # Простой текст без parse_mode: в сообщениях есть имена, адреса и комментарии покупателей,
+    # и любой символ < или & в них Telegram принял бы за разметку и отклонил сообщение с 400
     payload = {
         "chat_id": chat_id,
         "text": text,
-        "parse_mode": "HTML"
     }
-    try:
-        response = requests.post(TELEGRAM_API_URL, json=payload)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        print(f"Ошибка отправки в Telegram: {e}")
+    with track('http'):
+        return (session or requests).post(get_telegram_api_url(), json=payload, timeout=TELEGRAM_TIMEOUT)
@@ -0,0 +1,141 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import requests
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import TelegramMessage
+from .notifications import send_telegram_message
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+MAX_BACKOFF = 15 * 60
+# На время отправки сообщения уходят из очереди на LEASE секунд: другие воркеры их не берут,
+# а если воркер упал, сообщения снова станут доступны по истечении срока
+LEASE = 5 * 60
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    rate_limited: int = 0
+    latencies: list = field(default_factory=list)
+
+    def merge(self, other):
+        self.sent += other.sent
+        self.retried += other.retried
+        self.failed += other.failed
+        self.rate_limited += other.rate_limited
+        self.latencies.extend(other.latencies)
+
+    @property
+    def avg_latency_ms(self):
+        if not self.latencies:
+            return 0
+        return round(sum(self.latencies) / len(self.latencies) * 1000, 1)
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """Keep-alive сессия с пулом соединений по числу потоков отправки"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_retry_after(response: requests.Response):
+    try:
+        retry_after = response.json().get('parameters', {}).get('retry_after')
+    except ValueError:
+        retry_after = None
+    retry_after = retry_after or response.headers.get('Retry-After')
+    try:
+        return int(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempts: int) -> int:
+    return min(2 ** attempts, MAX_BACKOFF)
+
+
+def deliver(message: TelegramMessage, session: requests.Session):
+    """Отправляет одно сообщение; возвращает (успех, задержка до повтора, ошибка, время ответа, повтор бесполезен)"""
+    started = time.monotonic()
+    try:
+        response = send_telegram_message(message.chat_id, message.text, session=session)
+    except requests.RequestException as e:
+        return False, None, str(e), time.monotonic() - started, False
+
+    elapsed = time.monotonic() - started
+    if response.status_code == 429:
+        return False, get_retry_after(response), f'429: {response.text[:500]}', elapsed, False
+    if not response.ok:
+        # Остальные 4xx (неверный чат, бот удалён из группы, слишком длинный текст) повтор не исправит
+        permanent = 400 <= response.status_code < 500
+        return False, None, f'{response.status_code}: {response.text[:500]}', elapsed, permanent
+    return True, None, '', elapsed, False
+
+
+def claim_pending(batch_size: int):
+    """Короткой транзакцией забирает пачку готовых сообщений: откладывает их на LEASE и считает попытку"""
+    with transaction.atomic():
+        messages = list(
+            TelegramMessage.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=TelegramMessage.MessageStatus.PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        lease_until = timezone.now() + timedelta(seconds=LEASE)
+        for message in messages:
+            message.attempts += 1
+            message.next_attempt_at = lease_until
+        TelegramMessage.objects.bulk_update(messages, ['attempts', 'next_attempt_at'])
+    return messages
+
+
+def deliver_pending(session: requests.Session, batch_size: int = 50, concurrency: int = 4) -> DeliveryStats:
+    """Отправляет одну пачку готовых к отправке сообщений из outbox.
+
+    HTTP-запросы идут вне транзакции: строки не заблокированы, от других воркеров их защищает срок LEASE.
+    """
+    stats = DeliveryStats()
+    messages = claim_pending(batch_size)
+    if not messages:
+        return stats
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda message: deliver(message, session), messages))
+
+    now = timezone.now()
+    for message, (ok, retry_after, error, elapsed, permanent) in zip(messages, results):
+        stats.latencies.append(elapsed)
+        if ok:
+            message.status = TelegramMessage.MessageStatus.SENT
+            message.sent_at = now
+            message.last_error = ''
+            stats.sent += 1
+        elif permanent or message.attempts >= MAX_ATTEMPTS:
+            message.status = TelegramMessage.MessageStatus.FAILED
+            message.last_error = error
+            stats.failed += 1
+            logger.error('Сообщение #%s не доставлено: %s', message.id, error)
+        else:
+            if retry_after is not None:
+                stats.rate_limited += 1
+            delay = retry_after if retry_after is not None else backoff(message.attempts)
+            message.next_attempt_at = now + timedelta(seconds=delay)
+            message.last_error = error
+            stats.retried += 1
+
+    TelegramMessage.objects.bulk_update(messages, ['status', 'next_attempt_at', 'last_error', 'sent_at'])
+    return stats
@@ -3,25 +3,19 @@ from django.dispatch import receiver
 from django.conf import settings
 
 from core.models import Order, ConsultationRequest
-from .notifications import send_telegram_message
+from core.transitions import order_status_changed
+from .notifications import enqueue_telegram_message, format_order_for_courier
 
 
-@receiver(post_save, sender=Order)
-def order_paid_handler(sender, instance: Order, created, **kwargs):
-    if instance.status == Order.OrderStatus.PAID:
+@receiver(order_status_changed, sender=Order)
+def order_assigned_handler(sender, order: Order, previous, **kwargs):
+    if order.status == Order.OrderStatus.ASSIGNED and order.courier_id:
         courier_text = (
             f"🚚 Новый заказ для доставки!\n\n"
-            f"Курьер: {instance.courier.name}\n\n"
-            f"Адрес: {instance.delivery_address}\n"
-            f"Дата: {instance.delivery_date}, {instance.get_delivery_time_display()}\n"
-            f"Получатель: {instance.customer_name}, {instance.customer_phone}\n"
-            f"Товар: {instance.product} × {instance.quantity}\n"
-            f"Сумма: {instance.total_price} ₽"
+            f"Курьер: {order.courier.name}\n\n"
+            f"{format_order_for_courier(order)}"
         )
-        send_telegram_message(settings.TELEGRAM_GROUP_CHAT_ID, courier_text)
-
-        instance.status = Order.OrderStatus.ASSIGNED
-        instance.save()
+        enqueue_telegram_message(settings.TELEGRAM_GROUP_CHAT_ID, courier_text)
 
 
 @receiver(post_save, sender=ConsultationRequest)
@@ -33,7 +27,7 @@ def consultation_request_created(sender, instance: ConsultationRequest, created,
             f"Телефон: {instance.customer_phone}\n"
             f"Комментарий: \n{instance.comment or '—'}"
         )
-        send_telegram_message(settings.TELEGRAM_GROUP_CHAT_ID, text)
+        enqueue_telegram_message(settings.TELEGRAM_GROUP_CHAT_ID, text)
 
         instance.status = ConsultationRequest.RequestStatus.IN_PROGRESS
         instance.save(update_fields=["status"])
@@ -1,3 +1,172 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import TelegramMessage
+from core.models import Courier, Order, Product
+
+from .notifications import TELEGRAM_MESSAGE_LIMIT, enqueue_courier_digests, enqueue_telegram_message, split_message
+from .outbox import claim_pending, deliver, deliver_pending, make_session
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    responses = []
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        message = json.loads(body)
+        self.received.append(message)
+        status, payload = self.responses.pop(0) if self.responses else (200, {'ok': True})
+        # Как Telegram: неэкранированный < в HTML-разметке — ошибка разбора
+        if message.get('parse_mode') == 'HTML' and '<' in message['text']:
+            status, payload = 400, {'ok': False, 'description': "Bad Request: can't parse entities"}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxDeliveryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegramHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            TELEGRAM_API_BASE_URL=f'http://127.0.0.1:{cls.server.server_port}',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeTelegramHandler.responses = []
+        FakeTelegramHandler.received = []
+        self.session = make_session(2)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_pending_messages_are_sent(self):
+        for i in range(3):
+            enqueue_telegram_message('42', f'Сообщение {i}')
+
+        stats = deliver_pending(self.session, concurrency=2)
+
+        self.assertEqual(stats.sent, 3)
+        self.assertEqual(len(FakeTelegramHandler.received), 3)
+        self.assertFalse(TelegramMessage.objects.exclude(status=TelegramMessage.MessageStatus.SENT).exists())
+
+    def test_rate_limited_message_is_rescheduled_by_retry_after(self):
+        FakeTelegramHandler.responses = [(429, {'ok': False, 'parameters': {'retry_after': 30}})]
+        message = enqueue_telegram_message('42', 'Сообщение')
+
+        stats = deliver_pending(self.session)
+
+        message.refresh_from_db()
+        self.assertEqual(stats.rate_limited, 1)
+        self.assertEqual(message.status, TelegramMessage.MessageStatus.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(deliver_pending(self.session).sent, 0)
+
+    def test_permanent_client_error_fails_without_retry(self):
+        FakeTelegramHandler.responses = [(400, {'ok': False, 'description': 'Bad Request: chat not found'})]
+        message = enqueue_telegram_message('42', 'Сообщение')
+
+        with self.assertLogs('bot.outbox', 'ERROR'):
+            stats = deliver_pending(self.session)
+
+        message.refresh_from_db()
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(message.status, TelegramMessage.MessageStatus.FAILED)
+        self.assertEqual(message.attempts, 1)
+
+    def test_customer_text_is_sent_as_plain_text(self):
+        courier = Courier(pk=1, name='Иван')
+        order = Order(courier=courier, product=Product(name='Букет'), quantity=1, total_price=1000,
+                      customer_name='ООО <Ромашка> & Ко', customer_phone='+79990000000',
+                      delivery_address='ул. Садовая, д. 1 <домофон 12>', delivery_date=timezone.localdate(),
+                      delivery_time='10-12')
+        enqueue_courier_digests([order])
+
+        self.assertEqual(deliver_pending(self.session).sent, 1)
+
+        payload = FakeTelegramHandler.received[0]
+        self.assertNotIn('parse_mode', payload)
+        self.assertIn('Получатель: ООО <Ромашка> & Ко', payload['text'])
+
+    def test_messages_are_sent_outside_the_claiming_transaction(self):
+        enqueue_telegram_message('42', 'Сообщение')
+        main_connection = connections['default']
+        depth = len(main_connection.atomic_blocks)
+        depths_while_sending = []
+
+        def deliver_and_record(message, session):
+            depths_while_sending.append(len(main_connection.atomic_blocks))
+            return deliver(message, session)
+
+        with mock.patch('bot.outbox.deliver', deliver_and_record):
+            self.assertEqual(deliver_pending(self.session, concurrency=1).sent, 1)
+
+        self.assertEqual(depths_while_sending, [depth])
+
+    def test_claimed_messages_are_leased(self):
+        message = enqueue_telegram_message('42', 'Сообщение')
+
+        self.assertEqual(claim_pending(10), [message])
+
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(claim_pending(10), [])
+
+
+class MessageSplitTests(TestCase):
+    def test_long_text_is_split_on_line_boundaries(self):
+        lines = [f'{number}. ул. Садовая, д. {number}, кв. {number * 3}' for number in range(400)]
+
+        chunks = split_message('\n'.join(lines))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= TELEGRAM_MESSAGE_LIMIT for chunk in chunks))
+        self.assertEqual([line for chunk in chunks for line in chunk.split('\n')], lines)
+
+    def test_line_longer_than_limit_is_cut(self):
+        chunks = split_message('Короткая строка\n' + 'x' * 10000)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [15, 4096, 4096, 1808])
+
+    def test_busy_courier_digest_is_sent_in_several_messages(self):
+        courier = Courier(pk=1, name='Иван')
+        product = Product(name='Букет')
+        orders = [
+            Order(courier=courier, product=product, quantity=1, total_price=1000, customer_name='Анна',
+                  customer_phone='+79990000000', delivery_address=f'ул. Садовая, д. {number}',
+                  delivery_date=timezone.localdate(), delivery_time='10-12')
+            for number in range(60)
+        ]
+
+        enqueue_courier_digests(orders)
+
+        texts = list(TelegramMessage.objects.values_list('text', flat=True))
+        self.assertGreater(len(texts), 1)
+        self.assertTrue(all(len(text) <= TELEGRAM_MESSAGE_LIMIT for text in texts))
+        self.assertEqual('\n'.join(texts).count('Адрес: ул. Садовая'), 60)
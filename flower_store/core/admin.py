@@ -1,11 +1,24 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 
-from .models import (ConsultationRequest, Courier, Florist, Flower, Occasion,
+from bot.notifications import enqueue_courier_digests
+
+from .models import (ConsultationRequest, Courier, DailyProductSales,
+                     DeliverySlot, Florist, Flower, GeocodedAddress, Occasion,
                      Order, Product, ProductFlowerComposition, ProductOccasion)
+from .exports import CUSTOMER_COLUMNS, ORDER_COLUMNS, stream_csv
+from .rollups import sales_report
+from .search import search_consultations, search_orders, search_products
+from .templatetags.product_images import product_image_url
+from .transitions import TRANSITIONS, assign_couriers, bulk_set_status
 
 admin.site.unregister(Group)
 
@@ -15,10 +28,16 @@ class OccasionAdmin(admin.ModelAdmin):
     list_display = ['name', 'product_count']
     search_fields = ['name']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _product_count=Count('products', distinct=True)
+        )
+
     def product_count(self, obj):
-        return obj.products.count()
+        return obj._product_count
 
     product_count.short_description = 'Количество букетов'
+    product_count.admin_order_field = '_product_count'
 
 
 class ProductOccasionInline(admin.TabularInline):
@@ -58,35 +77,65 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        primary_occasion = ProductOccasion.objects.filter(
+            product=OuterRef('pk'),
+            is_primary=True
+        ).values('occasion__name')[:1]
+        return super().get_queryset(request).annotate(
+            _order_count=Count('orders', distinct=True),
+            _primary_occasion=Subquery(primary_occasion),
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_products(queryset, search_term), False
+
     def save_related(self, request, form, formsets, change):
         super().save_related(request, form, formsets, change)
         if not form.instance.productoccasion_set.exists():
             raise ValidationError('Добавьте хотя бы один повод для букета.')
 
     def primary_occasion(self, obj):
-        primary = obj.productoccasion_set.filter(is_primary=True).first()
-        return primary.occasion if primary else '-'
+        return obj._primary_occasion or '-'
 
     primary_occasion.short_description = 'Основной повод'
+    primary_occasion.admin_order_field = '_primary_occasion'
 
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', obj.image.url)
+            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', product_image_url(obj, 50))
         return '-'
 
     image_preview.short_description = 'Фото'
 
     def order_count(self, obj):
-        return obj.orders.count()
+        return obj._order_count
 
     order_count.short_description = 'Заказов'
-
-    def view_customers(self, obj): 
-        count = obj.orders.count()
+    order_count.admin_order_field = '_order_count'
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:product_id>/customers.csv',
+                self.admin_site.admin_view(self.export_customers),
+                name='core_product_customers_export',
+            ),
+        ] + super().get_urls()
+
+    def export_customers(self, request, product_id):
+        if not request.user.has_perm('core.view_order'):
+            raise PermissionDenied
+        product = get_object_or_404(Product, pk=product_id)
+        return stream_csv(f'customers-{product.pk}.csv', CUSTOMER_COLUMNS, product.get_customers())
+
+    def view_customers(self, obj):
         url = reverse('admin:core_order_changelist') + f'?product__id__exact={obj.id}'
-        return format_html('<a href="{}">{} клиентов</a>', url, count)
+        export_url = reverse('admin:core_product_customers_export', args=[obj.id])
+        return format_html('<a href="{}">{} клиентов</a> (<a href="{}">CSV</a>)', url, obj._order_count, export_url)
 
     view_customers.short_description = 'Клиенты'
+    view_customers.admin_order_field = '_order_count'
 
 
 @admin.register(Florist)
@@ -94,10 +143,16 @@ class FloristAdmin(admin.ModelAdmin):
     list_display = ['name', 'phone', 'email', 'consultation_count']
     search_fields = ['name', 'phone', 'email']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _consultation_count=Count('consultation_requests', distinct=True)
+        )
+
     def consultation_count(self, obj):
-        return obj.consultation_requests.count()
+        return obj._consultation_count
 
     consultation_count.short_description = 'Заявки'
+    consultation_count.admin_order_field = '_consultation_count'
 
 
 @admin.register(Courier)
@@ -105,10 +160,16 @@ class CourierAdmin(admin.ModelAdmin):
     list_display = ['name', 'phone', 'order_count']
     search_fields = ['name', 'phone']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _order_count=Count('orders', distinct=True)
+        )
+
     def order_count(self, obj):
-        return obj.orders.count()
+        return obj._order_count
 
     order_count.short_description = 'Заказы'
+    order_count.admin_order_field = '_order_count'
 
 
 @admin.register(Flower)
@@ -127,6 +188,8 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['customer_name', 'customer_phone', 'delivery_address', 'product__name']
     readonly_fields = ['created_at', 'total_price',]
     list_editable = ['status', 'delivery_time']
+    actions = ['mark_paid', 'mark_assigned', 'mark_delivered', 'mark_cancelled']
+    change_list_template = 'admin/core/order/change_list.html'
     fieldsets = (
         ('Информация о клиенте', {
             'fields': ('customer_name', 'customer_phone', 'customer_email')
@@ -145,6 +208,108 @@ class OrderAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('product', 'courier')
 
+    def get_search_results(self, request, queryset, search_term):
+        return search_orders(queryset, search_term), False
+
+    def get_urls(self):
+        return [
+            path(
+                'export.csv',
+                self.admin_site.admin_view(self.export_csv),
+                name='core_order_export',
+            ),
+        ] + super().get_urls()
+
+    def export_csv(self, request):
+        """Выгружает заказы с теми же фильтрами, поиском и сортировкой, что и в списке"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        queryset = self.get_changelist_instance(request).get_queryset(request)
+        return stream_csv('orders.csv', ORDER_COLUMNS, queryset)
+
+    def _assign_and_notify(self, request, ids):
+        assigned = assign_couriers(ids)
+        orders = Order.objects.filter(id__in=assigned).select_related('courier', 'product')
+        enqueue_courier_digests(orders)
+        self.message_user(request, f'Передано курьерам заказов: {len(assigned)}')
+
+    def mark_paid(self, request, queryset):
+        with transaction.atomic():
+            ids = bulk_set_status(queryset, Order.OrderStatus.PAID)
+            self._assign_and_notify(request, ids)
+
+    mark_paid.short_description = 'Отметить оплаченными и передать курьерам'
+
+    def mark_assigned(self, request, queryset):
+        with transaction.atomic():
+            ids = list(queryset.filter(status__in=TRANSITIONS[Order.OrderStatus.ASSIGNED]).values_list('id', flat=True))
+            self._assign_and_notify(request, ids)
+
+    mark_assigned.short_description = 'Передать курьерам'
+
+    def mark_delivered(self, request, queryset):
+        ids = bulk_set_status(queryset, Order.OrderStatus.DELIVERED)
+        self.message_user(request, f'Доставлено заказов: {len(ids)}')
+
+    mark_delivered.short_description = 'Отметить доставленными'
+
+    def mark_cancelled(self, request, queryset):
+        ids = bulk_set_status(queryset, Order.OrderStatus.CANCELLED)
+        self.message_user(request, f'Отменено заказов: {len(ids)}')
+
+    mark_cancelled.short_description = 'Отменить'
+
+
+@admin.register(DeliverySlot)
+class DeliverySlotAdmin(admin.ModelAdmin):
+    list_display = ['delivery_date', 'delivery_time', 'capacity', 'reserved']
+    list_filter = ['delivery_date', 'delivery_time']
+    list_editable = ['capacity']
+    readonly_fields = ['reserved']
+
+
+@admin.register(GeocodedAddress)
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    list_display = ['address', 'latitude', 'longitude', 'provider', 'updated_at']
+    list_filter = ['provider', ('latitude', admin.EmptyFieldListFilter)]
+    list_editable = ['latitude', 'longitude']
+    search_fields = ['address']
+
+
+def _parse_day(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+@admin.register(DailyProductSales)
+class SalesReportAdmin(admin.ModelAdmin):
+    """Отчёт по продажам вместо списка строк; данные берутся только из дневных отчётов"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        today = timezone.localdate()
+        start = _parse_day(request.GET.get('start')) or today.replace(day=1)
+        end = _parse_day(request.GET.get('end')) or today
+        return render(request, 'admin/sales_dashboard.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'start': start,
+            'end': end,
+            'report': sales_report(start, end),
+        })
+
 
 @admin.register(ConsultationRequest)
 class ConsultationRequestAdmin(admin.ModelAdmin):
@@ -171,6 +336,16 @@ class ConsultationRequestAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('florist')
 
+    def get_changelist_formset(self, request, **kwargs):
+        """Флористы для редактируемой колонки загружаются один раз на страницу, а не в каждой строке"""
+        formset = super().get_changelist_formset(request, **kwargs)
+        florist_field = formset.form.base_fields['florist']
+        florist_field.choices = list(florist_field.choices)
+        return formset
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_consultations(queryset, search_term), False
+
 
 admin.site.site_header = 'Администрирование цветочного магазина'
 admin.site.site_title = 'Цветочный магазин'
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+BROWSE = 'browse'
+CHECKOUT = 'checkout'
+PAYMENT = 'payment'
+ADMIN = 'admin'
+EXPORT = 'export'
+
+# Имя URL → класс запроса; всё, чего здесь нет (витрина, квиз, 404), — browse
+ROUTES = {
+    'core:order_step_delivery': CHECKOUT,
+    'core:delivery_slots': CHECKOUT,
+    'core:consultation': CHECKOUT,
+    'payments:pay': PAYMENT,
+    'payments:success': PAYMENT,
+    'payments:fail': PAYMENT,
+    'payments:webhook': PAYMENT,
+    # Выгрузки CSV держат место, пока отдаётся всё тело, поэтому у них свой класс и админка их не ждёт
+    'admin:core_order_export': EXPORT,
+    'admin:core_product_customers_export': EXPORT,
+}
+
+# Классы, которые отклоняются первыми, когда процесс перегружен или БД отвечает медленно
+SHED_UNDER_PRESSURE = {BROWSE}
+
+DB_LATENCY_SMOOTHING = 0.2
+ASYNC_POLL_INTERVAL = 0.01
+
+OVERLOADED_PAGE = (
+    '<!doctype html><meta charset="utf-8"><title>Flower Shop</title>'
+    '<p>Сейчас очень много посетителей. Обновите страницу через несколько секунд.</p>'
+)
+
+
+def classify(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return BROWSE
+    if match.view_name in ROUTES:
+        return ROUTES[match.view_name]
+    if ADMIN in match.namespaces:
+        return ADMIN
+    return BROWSE
+
+
+def overloaded_response():
+    response = HttpResponse(OVERLOADED_PAGE, status=503)
+    response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+    return response
+
+
+class RequestClass:
+    def __init__(self, name, limit, queue, wait):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.in_flight = 0
+        self.waiting = 0
+
+
+class AdmissionController:
+    """Лимиты одновременных запросов по классам внутри одного процесса.
+
+    Запрос сверх лимита класса ждёт в очереди не дольше wait секунд, если в ней есть место,
+    иначе сразу получает 503. Классы из SHED_UNDER_PRESSURE отклоняются без очереди,
+    пока в процессе не меньше max_in_flight запросов или средний запрос к БД дольше
+    db_latency_ms — кроме одного запроса класса, по которому видно, что нагрузка спала.
+    """
+
+    def __init__(self, classes, max_in_flight, db_latency_ms):
+        self.classes = {name: RequestClass(name, *limits) for name, limits in classes.items()}
+        self.max_in_flight = max_in_flight
+        self.db_latency_ms = db_latency_ms
+        self.in_flight = 0
+        self.db_latency = 0.0
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.ADMISSION_CLASSES, settings.ADMISSION_MAX_IN_FLIGHT, settings.ADMISSION_DB_LATENCY_MS)
+
+    def under_pressure(self):
+        return self.in_flight >= self.max_in_flight or self.db_latency > self.db_latency_ms
+
+    def _enter(self, request_class):
+        if request_class.in_flight >= request_class.limit:
+            return False
+        request_class.in_flight += 1
+        self.in_flight += 1
+        return True
+
+    def _try_admit(self, request_class):
+        """Под блокировкой: True — допущен, False — отклонён, None — встал в очередь"""
+        if request_class.name in SHED_UNDER_PRESSURE and request_class.in_flight and self.under_pressure():
+            return False
+        if self._enter(request_class):
+            return True
+        if request_class.waiting >= request_class.queue or not request_class.wait:
+            return False
+        request_class.waiting += 1
+        return None
+
+    def admit(self, name):
+        request_class = self.classes[name]
+        with self.lock:
+            admitted = self._try_admit(request_class)
+            if admitted is not None:
+                return admitted
+            deadline = time.monotonic() + request_class.wait
+            try:
+                while not self._enter(request_class):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.released.wait(remaining)
+                return True
+            finally:
+                request_class.waiting -= 1
+
+    async def aadmit(self, name):
+        """admit() для async-стека: очередь ждёт в event loop, не занимая поток"""
+        request_class = self.classes[name]
+        with self.lock:
+            admitted = self._try_admit(request_class)
+        if admitted is not None:
+            return admitted
+        deadline = time.monotonic() + request_class.wait
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(ASYNC_POLL_INTERVAL)
+                with self.lock:
+                    if self._enter(request_class):
+                        return True
+            return False
+        finally:
+            with self.lock:
+                request_class.waiting -= 1
+
+    def release(self, name, request_metrics=None):
+        """Освобождает место класса; по метрикам запроса обновляет среднюю задержку запроса к БД"""
+        request_class = self.classes[name]
+        with self.lock:
+            request_class.in_flight -= 1
+            self.in_flight -= 1
+            if request_metrics and request_metrics.queries:
+                latency = request_metrics.db * 1000 / request_metrics.queries
+                self.db_latency += DB_LATENCY_SMOOTHING * (latency - self.db_latency)
+            self.released.notify_all()
@@ -0,0 +1,215 @@
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from payments.fake_provider import FakeProvider
+
+from .models import (ConsultationRequest, Courier, Flower, Occasion, Order,
+                     Product, ProductFlowerComposition, ProductOccasion)
+
+# Подпись уведомлений об оплате в прогонах; задаётся как CLOUDPAYMENTS_API_SECRET на время прогона
+PAYMENT_SECRET = 'benchmark-secret'
+OCCASIONS = ['День рождения', 'Свадьба', 'Без повода', '8 марта', 'Юбилей', 'Выпускной']
+PRICE_RANGES = ['low', 'medium', 'high', 'any']
+
+
+def seed(products=300, flowers=40, couriers=10, orders=2000, consultations=500):
+    """Заполняет базу каталогом и историей заказов примерно как в рабочем магазине"""
+    rng = random.Random(42)
+
+    occasions = Occasion.objects.bulk_create(Occasion(name=name) for name in OCCASIONS)
+    flower_objs = Flower.objects.bulk_create(Flower(name=f'Цветок {i}') for i in range(flowers))
+    courier_objs = Courier.objects.bulk_create(
+        Courier(name=f'Курьер {i}', phone=f'+7999000{i:04d}') for i in range(couriers)
+    )
+
+    product_objs = []
+    compositions = {}
+    for i in range(products):
+        composition = rng.sample(flower_objs, 3)
+        quantities = [rng.randint(1, 9) for _ in composition]
+        compositions[i] = list(zip(composition, quantities))
+        product_objs.append(Product(
+            name=f'Букет {i}',
+            is_recommended=i < 3,
+            first_description='Букет из свежих цветов. ' * 5,
+            price=Decimal(rng.choice([500, 900, 1500, 3000, 4500, 6000, 9000])),
+            image=f'bench/{i}.jpg',
+            composition_display=', '.join(f'{f.name} - {q} шт.' for f, q in compositions[i]),
+        ))
+    product_objs = Product.objects.bulk_create(product_objs)
+
+    ProductOccasion.objects.bulk_create(
+        ProductOccasion(product=product, occasion=occasion, is_primary=index == 0)
+        for product in product_objs
+        for index, occasion in enumerate(rng.sample(occasions, 2))
+    )
+    ProductFlowerComposition.objects.bulk_create(
+        ProductFlowerComposition(product=product, flower=flower, quantity=quantity)
+        for i, product in enumerate(product_objs)
+        for flower, quantity in compositions[i]
+    )
+
+    today = timezone.now().date()
+    slots = [choice for choice, _ in Order.CHOICE]
+    statuses = [status for status, _ in Order.OrderStatus.choices]
+    order_objs = []
+    for i in range(orders):
+        product = rng.choice(product_objs)
+        order_objs.append(Order(
+            customer_name=f'Клиент {i}',
+            customer_phone=f'+7999{i:07d}',
+            delivery_address=f'ул. Цветочная, д. {i % 200}',
+            delivery_date=today - timedelta(days=rng.randint(0, 365)),
+            delivery_time=rng.choice(slots),
+            courier=rng.choice(courier_objs),
+            product=product,
+            total_price=product.price,
+            status=rng.choice(statuses),
+        ))
+    Order.objects.bulk_create(order_objs)
+
+    ConsultationRequest.objects.bulk_create(
+        ConsultationRequest(customer_name=f'Клиент {i}', customer_phone=f'+7998{i:07d}', comment='—')
+        for i in range(consultations)
+    )
+
+
+def funnel_steps(client, rng):
+    """Один проход покупателя: главная → квиз → букет → доставка → оплата, плюс консультация"""
+    occasion = rng.choice(OCCASIONS)
+
+    yield 'index', lambda: client.get(reverse('core:index'))
+    yield 'catalog', lambda: client.get(reverse('core:catalog'))
+    yield 'quiz_step_1', lambda: client.post(reverse('core:quiz_step'), {'occasion': occasion})
+    response = yield 'quiz_step_2', lambda: client.post(
+        reverse('core:quiz_step'), {'occasion': occasion, 'price_range': rng.choice(PRICE_RANGES)}
+    )
+
+    if response.status_code == 302:
+        bouquet_id = int(response.url.rstrip('/').rsplit('/', 1)[-1])
+    else:
+        bouquet_id = Product.objects.values_list('id', flat=True).first()
+
+    yield 'bouquet_item', lambda: client.get(reverse('core:bouquet_item', args=[bouquet_id]))
+    yield 'order_step_delivery', lambda: client.get(reverse('core:order_step_delivery', args=[bouquet_id]))
+    response = yield 'order_step_delivery_post', lambda: client.post(
+        reverse('core:order_step_delivery', args=[bouquet_id]),
+        {
+            'customer_name': 'Покупатель',
+            'customer_phone': '+79991234567',
+            'delivery_address': 'ул. Садовая, д. 1',
+            'delivery_time': rng.choice([choice for choice, _ in Order.CHOICE]),
+        },
+    )
+
+    pay_url = response.url
+    order_id = pay_url.split('order_id=')[1].split('&')[0]
+    yield 'payments_pay', lambda: client.get(pay_url)
+    yield 'payments_success', lambda: client.get(reverse('payments:success'), {'order_id': order_id})
+    provider = FakeProvider(PAYMENT_SECRET)
+    notification = provider.notification(Order.objects.get(pk=order_id))
+    yield 'payments_webhook', lambda: provider.send(
+        client, reverse('payments:webhook', args=['pay']), notification
+    )
+    yield 'consultation', lambda: client.get(reverse('core:consultation'))
+    yield 'consultation_post', lambda: client.post(
+        reverse('core:consultation'), {'fname': 'Покупатель', 'tel': '+79991234567'}
+    )
+
+
+def replay(iterations, trace_allocations=False, seed_value=0):
+    """Прогоняет воронку iterations раз; возвращает замеры по шагам"""
+    rng = random.Random(seed_value)
+    samples = {}
+
+    for _ in range(iterations):
+        client = Client()
+        steps = funnel_steps(client, rng)
+        response = None
+        while True:
+            try:
+                name, request = steps.send(response)
+            except StopIteration:
+                break
+
+            if trace_allocations:
+                tracemalloc.reset_peak()
+                baseline_memory = tracemalloc.get_traced_memory()[0]
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request()
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name}: HTTP {response.status_code}')
+
+            sample = samples.setdefault(name, {'latency': [], 'queries': [], 'alloc': []})
+            sample['latency'].append(elapsed)
+            sample['queries'].append(len(queries))
+            if trace_allocations:
+                sample['alloc'].append(tracemalloc.get_traced_memory()[1] - baseline_memory)
+    return samples
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def private_cache():
+    """Пустой кэш в памяти процесса на время прогона: общий кэш магазина не очищается и не получает
+    индексы и фрагменты тестовой базы под рабочими версиями"""
+    return override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'benchmark-{uuid.uuid4().hex}',
+    }})
+
+
+def run(iterations=50, warmup=3):
+    """Замеры p50/p95, числа запросов к БД и пиковых аллокаций на каждом шаге"""
+    with private_cache():
+        replay(warmup)
+        timings = replay(iterations, seed_value=1)
+
+        tracemalloc.start()
+        try:
+            allocations = replay(max(3, iterations // 10), trace_allocations=True, seed_value=2)
+        finally:
+            tracemalloc.stop()
+
+    report = {}
+    for name, sample in timings.items():
+        report[name] = {
+            'p50_ms': round(statistics.median(sample['latency']) * 1000, 2),
+            'p95_ms': round(percentile(sample['latency'], 95) * 1000, 2),
+            'queries': max(sample['queries']),
+            'alloc_kb': round(max(allocations[name]['alloc']) / 1024, 1),
+        }
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Список регрессий относительно сохранённого baseline"""
+    regressions = []
+    for name, current in report.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: запросов к БД {current['queries']} > {previous['queries']}")
+        for metric in ('p95_ms', 'alloc_kb'):
+            limit = previous[metric] * (1 + tolerance)
+            if current[metric] > limit:
+                regressions.append(f'{name}: {metric} {current[metric]} > {round(limit, 2)}')
+    return regressions
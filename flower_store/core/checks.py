@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Версии индекса квиза и фрагментов каталога лежат в кэше: локальный кэш процесса
+    не даст другим воркерам узнать о смене версии, и они будут отдавать устаревшие данные"""
+    if settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [Error(
+            'Кэш по умолчанию виден только одному процессу, версии каталога не дойдут до других воркеров.',
+            hint='Укажите общий бэкенд: CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache '
+                 'или django.core.cache.backends.redis.RedisCache.',
+            id='core.E001',
+        )]
+    return []
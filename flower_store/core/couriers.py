@@ -0,0 +1,63 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Courier, CourierLoad
+
+logger = logging.getLogger(__name__)
+
+
+def change_load(load_key, delta):
+    courier_id, delivery_date, delivery_time = load_key
+    load, _ = CourierLoad.objects.get_or_create(
+        courier_id=courier_id,
+        delivery_date=delivery_date,
+        delivery_time=delivery_time,
+    )
+    loads = CourierLoad.objects.filter(pk=load.pk)
+    if delta < 0:
+        loads = loads.filter(orders__gte=-delta)
+    loads.update(orders=F('orders') + delta)
+
+
+def assign_courier(order):
+    """Назначает заказу наименее загруженного курьера на его дату и слот доставки.
+
+    Счётчики слота блокируются на время транзакции, поэтому параллельные оплаты
+    не отдают один и тот же свободный слот двум заказам.
+    """
+    with transaction.atomic():
+        courier_ids = list(Courier.objects.values_list('id', flat=True))
+        if not courier_ids:
+            return None
+
+        CourierLoad.objects.bulk_create(
+            [
+                CourierLoad(
+                    courier_id=courier_id,
+                    delivery_date=order.delivery_date,
+                    delivery_time=order.delivery_time,
+                )
+                for courier_id in courier_ids
+            ],
+            ignore_conflicts=True,
+        )
+        loads = list(
+            CourierLoad.objects
+            .select_for_update(of=('self',))
+            .select_related('courier')
+            .filter(delivery_date=order.delivery_date, delivery_time=order.delivery_time)
+            .order_by('orders', 'courier_id')
+        )
+
+        free = [load for load in loads if load.orders < settings.COURIER_SLOT_CAPACITY]
+        if not free:
+            logger.warning(
+                'Все курьеры заняты на %s %s, заказ #%s назначен сверх лимита',
+                order.delivery_date, order.delivery_time, order.id,
+            )
+        load = (free or loads)[0]
+        order.courier = load.courier
+        return load.courier
@@ -0,0 +1,68 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+# Excel без BOM читает UTF-8 как однобайтовую кодировку, и кириллица превращается в мусор
+BOM = '\ufeff'
+# Ячейку с таким началом Excel и LibreOffice выполняют как формулу
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+ORDER_COLUMNS = (
+    ('id', 'Номер'),
+    ('created_at', 'Дата заказа'),
+    ('status', 'Статус'),
+    ('customer_name', 'Имя клиента'),
+    ('customer_phone', 'Телефон'),
+    ('customer_email', 'Email'),
+    ('product__name', 'Букет'),
+    ('quantity', 'Количество'),
+    ('total_price', 'Сумма'),
+    ('delivery_date', 'Дата доставки'),
+    ('delivery_time', 'Время доставки'),
+    ('delivery_address', 'Адрес доставки'),
+    ('courier__name', 'Курьер'),
+    ('comment', 'Комментарий'),
+)
+
+CUSTOMER_COLUMNS = (
+    ('name', 'Имя клиента'),
+    ('phone', 'Телефон'),
+    ('email', 'Email'),
+    ('order_date', 'Дата заказа'),
+    ('quantity', 'Количество'),
+)
+
+
+class Echo:
+    """Псевдофайл для csv.writer: отдаёт строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def escape_cell(value):
+    """Текст, который табличный редактор принял бы за формулу, начинается с апострофа.
+    Имена, адреса и комментарии вводят покупатели; числа и телефоны (PhoneNumber) остаются как есть."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(filename, columns, queryset):
+    """Отдаёт queryset в CSV по мере чтения, не загружая его в память целиком.
+
+    Строки читаются через iterator(), на PostgreSQL это серверный курсор.
+    """
+    writer = csv.writer(Echo())
+    fields = [field for field, _ in columns]
+
+    def rows():
+        yield BOM
+        yield writer.writerow([title for _, title in columns])
+        for row in queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield writer.writerow([escape_cell(value) for value in row])
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
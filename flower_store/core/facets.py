@@ -0,0 +1,149 @@
+from collections import defaultdict
+from functools import cached_property
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from . import replicas
+from .fragment_cache import get_catalog_version
+from .models import Product, ProductFlowerComposition, ProductOccasion
+from .recommendations import ANY, PRICE_RANGE_FILTERS, PRICE_RANGES, get_price_range
+
+INDEX_KEY = 'catalog:facets:{version}'
+INDEX_TIMEOUT = 60 * 60 * 24
+
+FACETS = {
+    'occasion': 'Повод',
+    'price_range': 'Бюджет',
+    'flower': 'Цветы',
+    'recommended': 'Подборка',
+}
+RECOMMENDED = 'yes'
+
+# Индекс текущей версии в памяти процесса, чтобы не распаковывать его из кэша на каждый запрос
+_local_index = (None, None)
+
+
+def build_facet_index():
+    """Множества id букетов для каждого значения каждого фасета"""
+    index = {facet: defaultdict(set) for facet in FACETS}
+    all_ids = set()
+
+    for product_id, price, is_recommended in Product.objects.values_list('id', 'price', 'is_recommended'):
+        all_ids.add(product_id)
+        index['price_range'][get_price_range(price)].add(product_id)
+        if is_recommended:
+            index['recommended'][RECOMMENDED].add(product_id)
+    for product_id, name in ProductOccasion.objects.values_list('product_id', 'occasion__name'):
+        index['occasion'][name].add(product_id)
+    for product_id, name in ProductFlowerComposition.objects.values_list('product_id', 'flower__name'):
+        index['flower'][name].add(product_id)
+
+    return {
+        'all': all_ids,
+        'facets': {facet: dict(values) for facet, values in index.items()},
+    }
+
+
+def get_facet_index():
+    global _local_index
+    version = get_catalog_version()
+    local_version, index = _local_index
+    if local_version == version:
+        return index
+
+    key = INDEX_KEY.format(version=version)
+    index = cache.get(key)
+    if index is None:
+        with replicas.primary():
+            index = build_facet_index()
+        cache.set(key, index, INDEX_TIMEOUT)
+    _local_index = (version, index)
+    return index
+
+
+def facet_condition(facet, values):
+    """Условие фасета для запроса к Product: то же, что даёт индекс, но без списка id в параметрах"""
+    if facet == 'occasion':
+        return Exists(ProductOccasion.objects.filter(product=OuterRef('pk'), occasion__name__in=values))
+    if facet == 'flower':
+        return Exists(ProductFlowerComposition.objects.filter(product=OuterRef('pk'), flower__name__in=values))
+    if facet == 'recommended':
+        return Q(is_recommended=True) if RECOMMENDED in values else Q(pk__in=[])
+    condition = Q(pk__in=[])
+    for value in values:
+        if value in PRICE_RANGE_FILTERS:
+            condition |= PRICE_RANGE_FILTERS[value]
+    return condition
+
+
+def get_value_label(facet, value):
+    if facet == 'price_range':
+        return PRICE_RANGES.get(value, value)
+    if facet == 'recommended':
+        return 'Рекомендуемые'
+    return value
+
+
+class FacetedSearch:
+    """Фильтрация каталога по фасетам и живые счётчики без запросов к БД.
+
+    Внутри фасета выбранные значения объединяются (ИЛИ), между фасетами — пересекаются (И).
+    Счётчик значения считается с учётом всех остальных фасетов, кроме его собственного.
+    Индекс загружается при первом обращении, поэтому при попадании фрагмента в кэш он не нужен.
+    """
+
+    def __init__(self, selected):
+        self.selected = {
+            facet: sorted(set(values) - {ANY, ''})
+            for facet, values in selected.items()
+            if facet in FACETS
+        }
+
+    @cached_property
+    def index(self):
+        return get_facet_index()
+
+    @property
+    def key(self):
+        return ';'.join(f'{facet}={",".join(values)}' for facet, values in sorted(self.selected.items()))
+
+    def matching_ids(self, exclude=None):
+        ids = self.index['all']
+        for facet, values in self.selected.items():
+            if facet == exclude or not values:
+                continue
+            facet_ids = set()
+            for value in values:
+                facet_ids |= self.index['facets'][facet].get(value, set())
+            ids = ids & facet_ids
+        return ids
+
+    def filter(self, queryset):
+        """Букеты, подходящие под выбранные фасеты, условиями в SQL"""
+        for facet, values in self.selected.items():
+            if values:
+                queryset = queryset.filter(facet_condition(facet, values))
+        return queryset
+
+    def facets(self):
+        result = []
+        for facet, title in FACETS.items():
+            available = self.matching_ids(exclude=facet)
+            values = self.index['facets'][facet]
+            order = PRICE_RANGES if facet == 'price_range' else sorted(values)
+            result.append({
+                'name': facet,
+                'title': title,
+                'values': [
+                    {
+                        'value': value,
+                        'label': get_value_label(facet, value),
+                        'count': len(values.get(value, set()) & available),
+                        'selected': value in self.selected.get(facet, []),
+                    }
+                    for value in order
+                    if value in values
+                ],
+            })
+        return result
@@ -0,0 +1,67 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import replicas
+
+VERSION_KEY = 'catalog:version'
+FRAGMENT_KEY = 'catalog:fragment:{name}:{vary}'
+LOCK_KEY = 'catalog:lock:{name}:{vary}'
+LOCK_TIMEOUT = 30
+
+
+def get_catalog_version():
+    # Начальная версия — текущее время: если ключ версии вытеснят из кэша,
+    # новая версия не совпадёт со старой и не подхватит устаревшие записи
+    return cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def make_vary_key(vary_on):
+    return hashlib.md5(':'.join(str(part) for part in vary_on).encode()).hexdigest()
+
+
+def get_or_render(name, vary_on, render):
+    """Возвращает закэшированный фрагмент каталога или строит его через render().
+
+    Фрагмент считается свежим, пока не сменилась версия каталога и не истёк
+    CATALOG_CACHE_FRESH. Устаревший фрагмент пересобирает только тот запрос,
+    который взял блокировку, остальные в это время получают старую версию.
+    render() читает с основной базы, а не с реплики.
+    """
+    vary = make_vary_key(vary_on)
+    key = FRAGMENT_KEY.format(name=name, vary=vary)
+    version = get_catalog_version()
+
+    entry = cache.get(key)
+    if entry:
+        entry_version, fresh_until, value = entry
+        if entry_version == version and fresh_until > time.time():
+            return value
+
+        lock_key = LOCK_KEY.format(name=name, vary=vary)
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            return value
+    else:
+        lock_key = None
+
+    try:
+        with replicas.primary():
+            value = render()
+        cache.set(
+            key,
+            (version, time.time() + settings.CATALOG_CACHE_FRESH, value),
+            settings.CATALOG_CACHE_STALE,
+        )
+    finally:
+        if lock_key:
+            cache.delete(lock_key)
+    return value
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core import signing
+from django.utils.functional import cached_property
+
+SESSION_KEY = 'order_data'
+COOKIE_NAME = 'order_data'
+COOKIE_SALT = 'core.funnel'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+
+
+class FunnelState:
+    """Данные воронки заказа (повод, бюджет, букет) за один запрос.
+
+    Изменения копятся в памяти и сохраняются один раз в конце запроса
+    (см. FunnelMiddleware), и только если значения действительно поменялись.
+    Хранилище задаётся FUNNEL_STORAGE: 'session' или подписанная cookie 'cookie'.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.storage = settings.FUNNEL_STORAGE
+
+    def _load_cookie(self):
+        try:
+            return signing.loads(
+                self.request.COOKIES.get(COOKIE_NAME, ''),
+                salt=COOKIE_SALT,
+                max_age=COOKIE_MAX_AGE,
+            )
+        except signing.BadSignature:
+            return {}
+
+    @cached_property
+    def initial(self):
+        if self.storage == 'cookie':
+            return self._load_cookie()
+        return self.request.session.get(SESSION_KEY, {})
+
+    @cached_property
+    def data(self):
+        return dict(self.initial)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def update(self, **changes):
+        self.data.update(changes)
+
+    @property
+    def changed(self):
+        return 'data' in self.__dict__ and self.data != self.initial
+
+    def _save_cookie(self, response):
+        response.set_cookie(
+            COOKIE_NAME,
+            signing.dumps(self.data, salt=COOKIE_SALT, compress=True),
+            max_age=COOKIE_MAX_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax',
+        )
+
+    def save(self, response):
+        if not self.changed:
+            return
+        if self.storage == 'cookie':
+            self._save_cookie(response)
+        else:
+            self.request.session[SESSION_KEY] = self.data
+
+    async def asave(self, response):
+        if not self.changed:
+            return
+        if self.storage == 'cookie':
+            self._save_cookie(response)
+        else:
+            await self.request.session.aset(SESSION_KEY, self.data)
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+MAX_DIMENSION = 2000
+WIDTHS = (320, 640, 1280)
+VARIANTS_DIR = 'variants'
+
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 6}),
+}
+if features.check('avif'):
+    FORMATS['avif'] = ('AVIF', 'avif', {'quality': 60})
+
+# Форматы, в которых оригинал перезаписывается как есть; остальные сохраняются в JPEG с расширением .jpg
+ORIGINAL_FORMATS = {
+    'JPEG': ('JPEG', 'jpg', FORMATS['jpeg'][2]),
+    'PNG': ('PNG', 'png', {'optimize': True}),
+    'WEBP': FORMATS['webp'],
+}
+
+MIME_TYPES = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+}
+
+
+def open_image(file):
+    image = Image.open(file)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    return image
+
+
+def encode(image, format_name, formats=FORMATS):
+    pil_format, _, options = formats[format_name]
+    if pil_format == 'JPEG' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    # exif не передаём, поэтому метаданные в производные файлы не попадают
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def normalize_original(field_file):
+    """Ограничивает размер оригинала и убирает из него EXIF, перезаписывая файл.
+
+    JPEG, PNG и WEBP остаются в своём формате (у PNG сохраняется прозрачность),
+    остальное перекодируется в JPEG под именем с расширением .jpg. Возвращает имя файла.
+    """
+    name = field_file.name
+    with field_file.open('rb') as file:
+        original = Image.open(file)
+        has_exif = bool(original.getexif())
+        too_large = max(original.size) > MAX_DIMENSION
+        source_format = original.format
+        if source_format in ORIGINAL_FORMATS and not has_exif and not too_large:
+            return name
+        image = open_image(file)
+
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    format_name = source_format if source_format in ORIGINAL_FORMATS else 'JPEG'
+    extension = ORIGINAL_FORMATS[format_name][1]
+    storage = field_file.storage
+    storage.delete(name)
+    new_name = f'{os.path.splitext(name)[0]}.{extension}' if format_name != source_format else name
+    return storage.save(new_name, ContentFile(encode(image, format_name, ORIGINAL_FORMATS)))
+
+
+def delete_variants(storage, variants):
+    for format_name, files in variants.items():
+        if format_name == 'source':
+            continue
+        for name in files.values():
+            storage.delete(name)
+
+
+def build_variants(field_file):
+    """Создаёт уменьшенные копии изображения во всех форматах.
+
+    Возвращает словарь вида {'source': имя оригинала, 'webp': {'320': имя файла, ...}, ...}.
+    В имени копий — хэш пути и содержимого оригинала: у букетов с фото rose.jpg и rose.png
+    копии разные, и удаление копий одного букета не задевает другой.
+    """
+    storage = field_file.storage
+    stem = os.path.splitext(os.path.basename(field_file.name))[0]
+
+    with field_file.open('rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(field_file.name.encode() + b'\0' + data).hexdigest()[:12]
+    image = open_image(BytesIO(data))
+
+    variants = {'source': field_file.name}
+    for width in WIDTHS:
+        if width > image.width and width != WIDTHS[0]:
+            break
+        resized = image.copy()
+        resized.thumbnail((width, MAX_DIMENSION), Image.LANCZOS)
+        for format_name, (_, extension, _) in FORMATS.items():
+            name = f'{VARIANTS_DIR}/{stem}-{digest}-{width}.{extension}'
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(encode(resized, format_name)))
+            variants.setdefault(format_name, {})[str(resized.width)] = name
+    return variants
+
+
+def process_product_image(product):
+    """Нормализует фото букета и пересобирает его производные изображения; копии прежнего фото удаляются"""
+    from .models import Product
+
+    try:
+        name = normalize_original(product.image)
+        if name != product.image.name:
+            product.image = name
+        delete_variants(product.image.storage, product.image_variants)
+        variants = build_variants(product.image)
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.error('Не удалось обработать фото букета #%s: %s', product.pk, e)
+        return
+
+    product.image_variants = variants
+    Product.objects.filter(pk=product.pk).update(image=product.image.name, image_variants=variants)
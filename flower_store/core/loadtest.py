@@ -0,0 +1,144 @@
+import asyncio
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.db import connection
+
+from .benchmark import percentile
+
+STOREFRONT_PATHS = ['/', '/catalog/', '/catalog-collect/', '/quiz-step/']
+READ_CHUNK = 4096
+
+
+async def fetch(host, port, path, slow_client=0.0):
+    """Один GET по голому HTTP/1.1. slow_client — пауза посреди отправки запроса и между
+    чтениями ответа, как у клиента на плохом мобильном интернете."""
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {host}\r\n'
+            'User-Agent: flower-store-loadtest\r\n'
+            'Connection: close\r\n\r\n'
+        ).encode()
+        middle = len(request) // 2
+        writer.write(request[:middle])
+        await writer.drain()
+        if slow_client:
+            await asyncio.sleep(slow_client)
+        writer.write(request[middle:])
+        await writer.drain()
+
+        status = None
+        while chunk := await reader.read(READ_CHUNK):
+            if status is None:
+                status = int(chunk.split(b' ', 2)[1])
+            if slow_client:
+                await asyncio.sleep(slow_client / 10)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return status, time.perf_counter() - started
+
+
+async def load_test(base_url, paths=STOREFRONT_PATHS, connections=50, duration=10.0, slow_client=0.0):
+    """Держит connections одновременных клиентов duration секунд и считает пропускную способность"""
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = 0
+    failed = 0
+
+    async def client(number):
+        nonlocal errors, failed
+        step = number
+        while time.monotonic() < deadline:
+            path = paths[step % len(paths)]
+            step += 1
+            try:
+                status, elapsed = await fetch(host, port, path, slow_client)
+            except (OSError, ValueError, IndexError):
+                errors += 1
+                continue
+            latencies.append(elapsed * 1000)
+            if not status or status >= 400:
+                failed += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(number) for number in range(connections)))
+    elapsed = time.monotonic() - started
+
+    return {
+        'connections': connections,
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+        'failed': failed,
+        'errors': errors,
+    }
+
+
+@contextmanager
+def serve(command, host, port, startup_timeout=30.0, env=None):
+    """Запускает сервер командой command и ждёт, пока он начнёт принимать соединения на host:port"""
+    process = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + startup_timeout
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'сервер завершился с кодом {process.returncode}')
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'сервер не начал слушать {host}:{port} за {startup_timeout} с')
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=startup_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+class ConnectionSampler(threading.Thread):
+    """Раз в interval секунд смотрит pg_stat_activity и запоминает максимум соединений к базе
+    (всего и выполняющих запрос). Своё соединение не считает. Только для PostgreSQL."""
+
+    SQL = (
+        "SELECT count(*), count(*) FILTER (WHERE state = 'active') FROM pg_stat_activity "
+        "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+    )
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_active = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                with connection.cursor() as cursor:
+                    cursor.execute(self.SQL)
+                    total, active = cursor.fetchone()
+                self.peak_total = max(self.peak_total, total)
+                self.peak_active = max(self.peak_active, active)
+                self.stopping.wait(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
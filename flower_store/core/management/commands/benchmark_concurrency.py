@@ -0,0 +1,52 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import STOREFRONT_PATHS, load_test
+
+
+def parse_target(value):
+    name, sep, url = value.partition('=')
+    if not sep or not url.startswith('http://'):
+        raise ValueError(value)
+    return name, url
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает уже запущенные серверы витрины одновременными соединениями '
+        'и сравнивает пропускную способность, например WSGI и ASGI'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', type=parse_target, action='append', required=True,
+            help='ИМЯ=http://хост:порт, можно указать несколько раз',
+        )
+        parser.add_argument('--connections', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--duration', type=float, default=10.0, help='Секунд на каждый уровень нагрузки')
+        parser.add_argument(
+            '--slow-client', type=float, default=0.0,
+            help='Секунд задержки на запрос у медленного клиента (0 — быстрые клиенты)',
+        )
+        parser.add_argument('--path', dest='paths', action='append', help='Страницы для обхода, по умолчанию витрина')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or STOREFRONT_PATHS
+        self.stdout.write(
+            f"{'сервер':<12}{'соедин.':>9}{'запросов':>10}{'RPS':>9}{'p50, мс':>10}{'p95, мс':>10}{'ошибок':>8}"
+        )
+        for connections in options['connections']:
+            for name, url in options['target']:
+                result = asyncio.run(load_test(
+                    url, paths,
+                    connections=connections,
+                    duration=options['duration'],
+                    slow_client=options['slow_client'],
+                ))
+                if not result['requests']:
+                    raise CommandError(f'{name}: сервер {url} не ответил ни на один запрос')
+                self.stdout.write(
+                    f"{name:<12}{connections:>9}{result['requests']:>10}{result['rps']:>9}"
+                    f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['failed'] + result['errors']:>8}"
+                )
@@ -0,0 +1,62 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from core import benchmark
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'storefront.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет воронку магазина на тестовой базе с реалистичными данными '
+        'и сравнивает задержки, число запросов и аллокации с baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--products', type=int, default=300)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true', help='Сохранить результат как новый baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='Допустимый рост p95 и аллокаций, доля')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            # Telegram не вызывается из запросов (outbox), адрес заглушки — на случай прямых вызовов.
+            # Версии кэша, которые сбрасывают сигналы при заполнении базы, тоже уходят в отдельный кэш
+            with override_settings(
+                TELEGRAM_API_BASE_URL='http://127.0.0.1:9',
+                CLOUDPAYMENTS_API_SECRET=benchmark.PAYMENT_SECRET,
+            ), benchmark.private_cache():
+                benchmark.seed(products=options['products'], orders=options['orders'])
+                report = benchmark.run(iterations=options['iterations'])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'шаг':<26}{'p50, мс':>10}{'p95, мс':>10}{'запросов':>10}{'аллок., КБ':>12}")
+        for name, row in report.items():
+            self.stdout.write(
+                f"{name:<26}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['queries']:>10}{row['alloc_kb']:>12}"
+            )
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline'] or not baseline_path.exists():
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+            self.stdout.write(self.style.SUCCESS(f'Baseline сохранён в {baseline_path}'))
+            return
+
+        regressions = benchmark.compare(report, json.loads(baseline_path.read_text()), options['tolerance'])
+        if regressions:
+            raise CommandError('Регрессия производительности:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий относительно baseline нет'))
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.loadtest import STOREFRONT_PATHS, ConnectionSampler, load_test, serve
+
+
+class Command(BaseCommand):
+    help = (
+        'Поднимает gunicorn с профилем gunicorn.conf.py при разном числе воркеров, нагружает витрину '
+        'и показывает пропускную способность и пик соединений с PostgreSQL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[4, 8, 16])
+        parser.add_argument('--threads', type=int, help='Потоков на воркер, по умолчанию из gunicorn.conf.py')
+        parser.add_argument('--connections', type=int, default=64, help='Одновременных клиентов')
+        parser.add_argument('--duration', type=float, default=15.0, help='Секунд на каждый прогон')
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--path', dest='paths', action='append', help='Страницы для обхода, по умолчанию витрина')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or STOREFRONT_PATHS
+        postgres = connection.vendor == 'postgresql'
+        if not postgres:
+            self.stderr.write('База не PostgreSQL: соединения считаться не будут')
+
+        self.stdout.write(
+            f"{'воркеров':>9}{'запросов':>10}{'RPS':>9}{'p50, мс':>10}{'p95, мс':>10}{'ошибок':>8}"
+            f"{'соедин. БД':>12}{'активных':>10}"
+        )
+        for workers in options['workers']:
+            command = [
+                sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                '--workers', str(workers), '--bind', f"127.0.0.1:{options['port']}",
+            ]
+            server_env = None
+            if options['threads']:
+                command += ['--threads', str(options['threads'])]
+                # Размер пула соединений в settings берётся из GUNICORN_THREADS
+                server_env = {**os.environ, 'GUNICORN_THREADS': str(options['threads'])}
+
+            sampler = ConnectionSampler() if postgres else None
+            try:
+                with serve(command, '127.0.0.1', options['port'], env=server_env):
+                    if sampler:
+                        sampler.start()
+                    result = asyncio.run(load_test(
+                        f"http://127.0.0.1:{options['port']}", paths,
+                        connections=options['connections'],
+                        duration=options['duration'],
+                    ))
+            except RuntimeError as error:
+                raise CommandError(f'{workers} воркеров: {error}')
+            finally:
+                if sampler and sampler.is_alive():
+                    sampler.stop()
+
+            if not result['requests']:
+                raise CommandError(f'{workers} воркеров: сервер не ответил ни на один запрос')
+            total, active = (sampler.peak_total, sampler.peak_active) if sampler else ('—', '—')
+            self.stdout.write(
+                f"{workers:>9}{result['requests']:>10}{result['rps']:>9}{result['p50_ms']:>10}"
+                f"{result['p95_ms']:>10}{result['failed'] + result['errors']:>8}{total:>12}{active:>10}"
+            )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.images import process_product_image
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии фотографий букетов (webp/avif/jpeg)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии, даже если они уже есть')
+
+    def handle(self, *args, **options):
+        processed = 0
+        for product in Product.objects.only('id', 'image', 'image_variants').iterator(chunk_size=100):
+            if not product.image:
+                continue
+            if not options['force'] and product.image_variants.get('source') == product.image.name:
+                continue
+            process_product_image(product)
+            processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано фотографий: {processed}'))
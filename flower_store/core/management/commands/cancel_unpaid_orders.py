@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.transitions import cancel_unpaid_orders
+
+
+class Command(BaseCommand):
+    help = 'Отменяет заказы, не оплаченные за UNPAID_ORDER_MINUTES, и освобождает их места в слотах доставки'
+
+    def handle(self, *args, **options):
+        ids = cancel_unpaid_orders()
+        self.stdout.write(self.style.SUCCESS(
+            f'Отменено неоплаченных заказов старше {settings.UNPAID_ORDER_MINUTES} мин.: {len(ids)}'
+        ))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from bot.notifications import enqueue_long_message
+from core.routing import format_manifest, plan_routes
+
+
+class Command(BaseCommand):
+    help = 'Строит маршрутные листы курьеров на день и при необходимости отправляет их в Telegram'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=parse_date, help='Дата доставки в формате ГГГГ-ММ-ДД, по умолчанию сегодня')
+        parser.add_argument('--send', action='store_true', help='Поставить маршрутные листы в очередь Telegram')
+
+    def handle(self, *args, **options):
+        date = options['date'] or timezone.localdate()
+        manifests = plan_routes(date)
+
+        for manifest in manifests:
+            text = format_manifest(manifest)
+            self.stdout.write(text + '\n')
+            if options['send']:
+                enqueue_long_message(settings.TELEGRAM_GROUP_CHAT_ID, text)
+
+        deliveries = sum(manifest.deliveries for manifest in manifests)
+        hours = sum(manifest.hours for manifest in manifests)
+        rate = deliveries / hours if hours else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Курьеров: {len(manifests)}, доставок: {deliveries}, доставок на курьеро-час: {rate:.2f}'
+        ))
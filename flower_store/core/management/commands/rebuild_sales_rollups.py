@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.models import DailyCourierSales, DailyOccasionSales, DailyProductSales
+from core.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает дневные отчёты по продажам из таблицы заказов'
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк отчётов: букеты {DailyProductSales.objects.count()}, '
+            f'поводы {DailyOccasionSales.objects.count()}, '
+            f'курьеры {DailyCourierSales.objects.count()}'
+        ))
@@ -0,0 +1,115 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счётчики одного запроса: БД, шаблоны и внешние HTTP-вызовы (Telegram, геокодер).
+
+    Время шаблонов включает запросы к БД, которые шаблон сделал лениво.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.http = 0.0
+        self.http_calls = 0
+        self.shapes = Counter()
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def repeated_queries(self):
+        """Одинаковые SQL (с разными параметрами), выполненные не меньше порога раз: похоже на N+1"""
+        threshold = settings.REQUEST_METRICS_N_PLUS_ONE
+        return [(sql, count) for sql, count in self.shapes.most_common(3) if count >= threshold]
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.templates * 1000:.1f}',
+            f'http;dur={self.http * 1000:.1f};desc="{self.http_calls} calls"',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
+
+    def as_dict(self, request, response):
+        match = request.resolver_match
+        return {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(self.total * 1000, 1),
+            'db_ms': round(self.db * 1000, 1),
+            'queries': self.queries,
+            'template_ms': round(self.templates * 1000, 1),
+            'http_ms': round(self.http * 1000, 1),
+            'http_calls': self.http_calls,
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper для всех соединений; вне запроса ничего не считает"""
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db += time.perf_counter() - started
+        metrics.queries += 1
+        metrics.shapes[sql] += 1
+
+
+def install_query_recorder(connection):
+    # В начало списка: соединение может открыться внутри чужого connection.execute_wrapper(),
+    # а он на выходе снимает последнюю обёртку
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def track(kind):
+    """Добавляет время блока к счётчику kind ('templates' или 'http') текущего запроса"""
+    metrics = current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(metrics, kind, getattr(metrics, kind) + time.perf_counter() - started)
+        if kind == 'http':
+            metrics.http_calls += 1
+
+
+def start():
+    metrics = RequestMetrics()
+    return metrics, current.set(metrics)
+
+
+def finish(metrics, token, request, response):
+    current.reset(token)
+    if settings.SERVER_TIMING:
+        response['Server-Timing'] = metrics.server_timing()
+
+    record = metrics.as_dict(request, response)
+    repeated = metrics.repeated_queries()
+    if repeated:
+        record['repeated_queries'] = [{'sql': sql[:300], 'count': count} for sql, count in repeated]
+        logger.warning(json.dumps(record, ensure_ascii=False))
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,150 @@
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import admission, metrics, replicas
+from .funnel import FunnelState
+
+
+class FunnelMiddleware:
+    """Даёт view request.funnel и сохраняет его один раз после ответа.
+
+    Должен стоять после SessionMiddleware, чтобы успеть изменить сессию
+    до того, как она будет записана. Работает и в синхронном, и в асинхронном стеке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.funnel = FunnelState(request)
+        response = self.get_response(request)
+        request.funnel.save(response)
+        return response
+
+    async def __acall__(self, request):
+        request.funnel = FunnelState(request)
+        response = await self.get_response(request)
+        await request.funnel.asave(response)
+        return response
+
+
+class RequestMetricsMiddleware:
+    """Считает запросы к БД и время БД, шаблонов и внешних HTTP-вызовов по каждому view.
+
+    Отдаёт их в заголовке Server-Timing и пишет строкой JSON в лог core.metrics на уровне DEBUG;
+    повторяющиеся одинаковые SQL (N+1) логируются как предупреждение.
+    Должен стоять первым в MIDDLEWARE, чтобы total покрывал весь запрос.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_metrics, token = metrics.start()
+        response = self.get_response(request)
+        metrics.finish(request_metrics, token, request, response)
+        return response
+
+    async def __acall__(self, request):
+        request_metrics, token = metrics.start()
+        response = await self.get_response(request)
+        metrics.finish(request_metrics, token, request, response)
+        return response
+
+
+class ReplicaMiddleware:
+    """Выбирает реплику для чтения на время запроса (см. core.replicas.ReplicaRouter)
+    и после записи ставит cookie, закрепляющую клиента за основной базой на REPLICA_PIN_SECONDS."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = replicas.start(request)
+        response = self.get_response(request)
+        replicas.finish(state, token, response)
+        return response
+
+    async def __acall__(self, request):
+        state, token = replicas.start(request)
+        response = await self.get_response(request)
+        replicas.finish(state, token, response)
+        return response
+
+
+class AdmissionMiddleware:
+    """Ограничивает одновременные запросы по классам (витрина, оформление, оплата, админка)
+    и при перегрузке отвечает 503 с Retry-After, в первую очередь на запросы витрины.
+
+    Должен стоять сразу после RequestMetricsMiddleware: отклонённый запрос не трогает сессию и БД,
+    а задержка БД берётся из метрик запроса. Отключается ADMISSION_CONTROL=False.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.controller = admission.AdmissionController.from_settings()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_class = admission.classify(request)
+        if not self.controller.admit(request_class):
+            return admission.overloaded_response()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self.controller.release(request_class, metrics.current.get())
+            raise
+        return self.release_on_close(request_class, response)
+
+    async def __acall__(self, request):
+        request_class = admission.classify(request)
+        if not await self.controller.aadmit(request_class):
+            return admission.overloaded_response()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self.controller.release(request_class, metrics.current.get())
+            raise
+        return self.release_on_close(request_class, response)
+
+    def release_on_close(self, request_class, response):
+        """Потоковый ответ (выгрузка CSV) продолжает работать, пока сервер отправляет тело,
+        поэтому его место освобождается при закрытии ответа, а не при выходе из view"""
+        release = partial(self.controller.release, request_class, metrics.current.get())
+        if response.streaming:
+            response._resource_closers.append(release)
+        else:
+            release()
+        return response
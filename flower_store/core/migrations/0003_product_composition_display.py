@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+def fill_composition_display(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductFlowerComposition = apps.get_model('core', 'ProductFlowerComposition')
+
+    for product in Product.objects.all():
+        compositions = (
+            ProductFlowerComposition.objects
+            .filter(product=product)
+            .select_related('flower')
+            .order_by('id')
+        )
+        product.composition_display = ', '.join(
+            f'{comp.flower.name} - {comp.quantity} шт.' for comp in compositions
+        )
+        product.save(update_fields=['composition_display'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_order_delivery_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='composition_display',
+            field=models.TextField(blank=True, editable=False, verbose_name='Состав букета'),
+        ),
+        migrations.RunPython(fill_composition_display, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_courier_load(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    CourierLoad = apps.get_model('core', 'CourierLoad')
+
+    loads = (
+        Order.objects
+        .filter(courier__isnull=False, status__in=['paid', 'assigned'])
+        .values('courier_id', 'delivery_date', 'delivery_time')
+        .annotate(orders=models.Count('id'))
+        .order_by()
+    )
+    CourierLoad.objects.bulk_create(CourierLoad(**load) for load in loads)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_product_composition_display'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourierLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_date', models.DateField(verbose_name='Дата доставки')),
+                ('delivery_time', models.CharField(choices=[('any', 'Как можно скорее'), ('10-12', '10:00 - 12:00'), ('12-14', '12:00 - 14:00'), ('14-16', '14:00 - 16:00'), ('16-18', '16:00 - 18:00'), ('18-20', '18:00 - 20:00')], max_length=20, verbose_name='Время доставки')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Активных заказов')),
+                ('courier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loads', to='core.courier', verbose_name='Курьер')),
+            ],
+            options={
+                'verbose_name': 'Загрузка курьера',
+                'verbose_name_plural': 'Загрузка курьеров',
+                'unique_together': {('courier', 'delivery_date', 'delivery_time')},
+            },
+        ),
+        migrations.RunPython(fill_courier_load, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:45
+
+import phonenumber_field.modelfields
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+TRIGRAM_INDEXES = [
+    ('core_order_customer_name_trgm', 'core_order', 'customer_name'),
+    ('core_order_delivery_address_trgm', 'core_order', 'delivery_address'),
+    ('core_product_name_trgm', 'core_product', 'name'),
+    ('core_product_first_description_trgm', 'core_product', 'first_description'),
+    ('core_consultation_customer_name_trgm', 'core_consultationrequest', 'customer_name'),
+]
+
+FULL_TEXT_INDEXES = [
+    ('core_order_search_fts', 'core_order', "customer_name || ' ' || delivery_address"),
+    ('core_product_search_fts', 'core_product', "name || ' ' || first_description"),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # UPPER(col::text) — так Django компилирует icontains, поэтому индекс подходит для ILIKE-поиска админки
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+    for name, table, document in FULL_TEXT_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (to_tsvector('russian', {document}))"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, *_ in TRIGRAM_INDEXES + FULL_TEXT_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_product_image_variants'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AlterField(
+            model_name='consultationrequest',
+            name='customer_phone',
+            field=phonenumber_field.modelfields.PhoneNumberField(db_index=True, max_length=20, region='RU', verbose_name='Телефон клиента'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='customer_phone',
+            field=phonenumber_field.modelfields.PhoneNumberField(db_index=True, max_length=128, region='RU', verbose_name='Телефон клиента'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
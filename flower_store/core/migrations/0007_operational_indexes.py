@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultationrequest',
+            index=models.Index(fields=['status', '-created_at'], name='consultation_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultationrequest',
+            index=models.Index(fields=['-created_at'], name='consultation_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'delivery_date', 'delivery_time'], name='order_status_delivery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['delivered', 'cancelled']), _negated=True), fields=['courier', 'delivery_date'], name='order_courier_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['product', '-created_at'], name='order_product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='order_created_idx'),
+        ),
+    ]
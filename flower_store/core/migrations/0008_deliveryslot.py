@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:48
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Значение DELIVERY_SLOT_CAPACITY на момент создания таблицы: миграция не должна зависеть от текущих настроек
+DELIVERY_SLOT_CAPACITY = 30
+
+
+def fill_delivery_slots(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    DeliverySlot = apps.get_model('core', 'DeliverySlot')
+
+    reserved = (
+        Order.objects
+        .filter(delivery_date__gte=timezone.now().date())
+        .exclude(status='cancelled')
+        .values('delivery_date', 'delivery_time')
+        .annotate(reserved=models.Count('id'))
+        .order_by()
+    )
+    DeliverySlot.objects.bulk_create(
+        DeliverySlot(capacity=max(DELIVERY_SLOT_CAPACITY, slot['reserved']), **slot)
+        for slot in reserved
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_operational_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliverySlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_date', models.DateField(verbose_name='Дата доставки')),
+                ('delivery_time', models.CharField(choices=[('any', 'Как можно скорее'), ('10-12', '10:00 - 12:00'), ('12-14', '12:00 - 14:00'), ('14-16', '14:00 - 16:00'), ('16-18', '16:00 - 18:00'), ('18-20', '18:00 - 20:00')], max_length=20, verbose_name='Время доставки')),
+                ('capacity', models.PositiveIntegerField(verbose_name='Вместимость слота')),
+                ('reserved', models.PositiveIntegerField(default=0, verbose_name='Забронировано')),
+            ],
+            options={
+                'verbose_name': 'Слот доставки',
+                'verbose_name_plural': 'Слоты доставки',
+                'ordering': ['delivery_date', 'delivery_time'],
+                'unique_together': {('delivery_date', 'delivery_time')},
+            },
+        ),
+        migrations.RunPython(fill_delivery_slots, migrations.RunPython.noop),
+    ]
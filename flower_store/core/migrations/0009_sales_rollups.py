@@ -0,0 +1,91 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_sales_rollups(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    DailyProductSales = apps.get_model('core', 'DailyProductSales')
+    DailyOccasionSales = apps.get_model('core', 'DailyOccasionSales')
+    DailyCourierSales = apps.get_model('core', 'DailyCourierSales')
+
+    sold = Order.objects.filter(status__in=['paid', 'assigned', 'delivered']).order_by()
+    day = TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+    totals = {'orders': models.Count('id'), 'revenue': models.Sum('total_price')}
+
+    DailyProductSales.objects.bulk_create(
+        DailyProductSales(**row)
+        for row in sold.values('product_id', date=day).annotate(quantity=models.Sum('quantity'), **totals)
+    )
+    DailyOccasionSales.objects.bulk_create(
+        DailyOccasionSales(**row)
+        for row in sold.filter(product__productoccasion__isnull=False).values(
+            date=day, occasion_id=models.F('product__productoccasion__occasion_id')
+        ).annotate(**totals)
+    )
+    DailyCourierSales.objects.bulk_create(
+        DailyCourierSales(**row)
+        for row in sold.filter(courier__isnull=False).values(
+            'courier_id', date=models.F('delivery_date')
+        ).annotate(**totals)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_deliveryslot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCourierSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата доставки')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка')),
+                ('courier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='core.courier', verbose_name='Курьер')),
+            ],
+            options={
+                'verbose_name': 'Заказы курьера за день',
+                'verbose_name_plural': 'Заказы курьеров по дням',
+                'unique_together': {('date', 'courier')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyOccasionSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка')),
+                ('occasion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='core.occasion', verbose_name='Повод')),
+            ],
+            options={
+                'verbose_name': 'Продажи по поводу за день',
+                'verbose_name_plural': 'Продажи по поводам по дням',
+                'unique_together': {('date', 'occasion')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Букетов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='core.product', verbose_name='Букет')),
+            ],
+            options={
+                'verbose_name': 'Продажи букета за день',
+                'verbose_name_plural': 'Продажи букетов по дням',
+                'unique_together': {('date', 'product')},
+            },
+        ),
+        migrations.RunPython(fill_sales_rollups, migrations.RunPython.noop),
+    ]
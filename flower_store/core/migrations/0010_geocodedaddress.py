@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodedAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=500, unique=True, verbose_name='Адрес')),
+                ('latitude', models.FloatField(blank=True, null=True, verbose_name='Широта')),
+                ('longitude', models.FloatField(blank=True, null=True, verbose_name='Долгота')),
+                ('provider', models.CharField(blank=True, max_length=50, verbose_name='Источник')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Координаты адреса',
+                'verbose_name_plural': 'Координаты адресов',
+            },
+        ),
+    ]
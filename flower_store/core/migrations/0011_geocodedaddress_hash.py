@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:40
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_address_hashes(apps, schema_editor):
+    GeocodedAddress = apps.get_model('core', 'GeocodedAddress')
+    rows = list(GeocodedAddress.objects.only('id', 'address'))
+    for row in rows:
+        row.address_hash = hashlib.sha256(row.address.encode()).hexdigest()
+    GeocodedAddress.objects.bulk_update(rows, ['address_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_geocodedaddress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='geocodedaddress',
+            name='address',
+            field=models.TextField(verbose_name='Адрес'),
+        ),
+        migrations.AddField(
+            model_name='geocodedaddress',
+            name='address_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, verbose_name='Хэш адреса'),
+        ),
+        migrations.RunPython(fill_address_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='geocodedaddress',
+            name='address_hash',
+            field=models.CharField(editable=False, max_length=64, unique=True, verbose_name='Хэш адреса'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:30
+
+from django.db import migrations
+
+# Поиск по части номера — customer_phone__contains, Django компилирует его в "customer_phone"::text LIKE '%...%':
+# B-tree индекс такой поиск не использует, trigram-индекс по тому же выражению — использует
+PHONE_TRIGRAM_INDEXES = [
+    ('core_order_customer_phone_trgm', 'core_order'),
+    ('core_consultation_customer_phone_trgm', 'core_consultationrequest'),
+]
+
+
+def create_phone_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in PHONE_TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((customer_phone::text) gin_trgm_ops)'
+        )
+
+
+def drop_phone_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in PHONE_TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_geocodedaddress_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_phone_indexes, drop_phone_indexes),
+    ]
@@ -1,3 +1,5 @@
+import hashlib
+
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
@@ -94,6 +96,17 @@ class Product(models.Model):
     image = models.ImageField(
         verbose_name='Фотография букета'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии фотографии'
+    )
+    composition_display = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Состав букета'
+    )
 
     class Meta:
         verbose_name = 'Букет'
@@ -106,18 +119,23 @@ class Product(models.Model):
         primary = self.productoccasion_set.filter(is_primary=True).first()
         return primary.occasion if primary else None
 
+    def refresh_composition_display(self):
+        compositions = self.flower_composition.select_related('flower').order_by('id')
+        self.composition_display = ', '.join(str(comp) for comp in compositions)
+        Product.objects.filter(pk=self.pk).update(composition_display=self.composition_display)
+
     def get_customers(self):
-        orders = self.orders.select_related('customer_name', 'customer_phone', 'customer_email')
-        return [
-            {
-                'name': order.customer_name,
-                'phone': order.customer_phone,
-                'email': order.customer_email,
-                'order_date': order.created_at,
-                'quantity': order.quantity
-            }
-            for order in orders
-        ]
+        """Клиенты, заказывавшие букет, в порядке от новых заказов к старым.
+
+        Возвращает ленивый queryset словарей; для больших выборок читайте его через iterator().
+        """
+        return self.orders.order_by('-created_at').values(
+            'quantity',
+            name=models.F('customer_name'),
+            phone=models.F('customer_phone'),
+            email=models.F('customer_email'),
+            order_date=models.F('created_at'),
+        )
 
     def clean(self):
         super().clean()
@@ -202,6 +220,7 @@ class Order(models.Model):
     )
     customer_phone = PhoneNumberField(
         verbose_name='Телефон клиента',
+        db_index=True,
         region='RU'
     )
     customer_email = models.EmailField(
@@ -267,10 +286,31 @@ class Order(models.Model):
         verbose_name='Дата создания заказа'
     )
 
+    ACTIVE_STATUSES = (OrderStatus.PAID, OrderStatus.ASSIGNED)
+
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['status', 'delivery_date', 'delivery_time'],
+                name='order_status_delivery_idx'
+            ),
+            models.Index(
+                fields=['courier', 'delivery_date'],
+                condition=~models.Q(status__in=['delivered', 'cancelled']),
+                name='order_courier_active_idx'
+            ),
+            models.Index(
+                fields=['product', '-created_at'],
+                name='order_product_created_idx'
+            ),
+            models.Index(
+                fields=['-created_at'],
+                name='order_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} - {self.customer_name} ({self.status})"
@@ -290,6 +330,20 @@ class Order(models.Model):
 
         super().save(*args, **kwargs)
 
+    @property
+    def load_key(self):
+        """Ячейка загрузки курьера (курьер, дата, слот), которую занимает заказ"""
+        if self.courier_id and self.status in self.ACTIVE_STATUSES:
+            return self.courier_id, self.delivery_date, self.delivery_time
+        return None
+
+    @property
+    def slot_key(self):
+        """Слот доставки (дата, время), который занимает заказ"""
+        if self.status != self.OrderStatus.CANCELLED:
+            return self.delivery_date, self.delivery_time
+        return None
+
     @property
     def formatted_total_price(self):
         return f"{self.total_price} руб."
@@ -299,6 +353,206 @@ class Order(models.Model):
         return self.product.price if self.product else 0
 
 
+class CourierLoad(models.Model):
+    courier = models.ForeignKey(
+        Courier,
+        on_delete=models.CASCADE,
+        verbose_name='Курьер',
+        related_name='loads'
+    )
+    delivery_date = models.DateField(
+        verbose_name='Дата доставки'
+    )
+    delivery_time = models.CharField(
+        max_length=20,
+        choices=Order.CHOICE,
+        verbose_name='Время доставки'
+    )
+    orders = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Активных заказов'
+    )
+
+    class Meta:
+        verbose_name = 'Загрузка курьера'
+        verbose_name_plural = 'Загрузка курьеров'
+        unique_together = ['courier', 'delivery_date', 'delivery_time']
+
+    def __str__(self):
+        return f'{self.courier} {self.delivery_date} {self.delivery_time}: {self.orders}'
+
+
+class DeliverySlot(models.Model):
+    delivery_date = models.DateField(
+        verbose_name='Дата доставки'
+    )
+    delivery_time = models.CharField(
+        max_length=20,
+        choices=Order.CHOICE,
+        verbose_name='Время доставки'
+    )
+    capacity = models.PositiveIntegerField(
+        verbose_name='Вместимость слота'
+    )
+    reserved = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Забронировано'
+    )
+
+    class Meta:
+        verbose_name = 'Слот доставки'
+        verbose_name_plural = 'Слоты доставки'
+        ordering = ['delivery_date', 'delivery_time']
+        unique_together = ['delivery_date', 'delivery_time']
+
+    def __str__(self):
+        return f'{self.delivery_date} {self.get_delivery_time_display()}: {self.reserved}/{self.capacity}'
+
+    @property
+    def available(self):
+        return max(self.capacity - self.reserved, 0)
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField(
+        verbose_name='Дата'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name='Букет',
+        related_name='daily_sales'
+    )
+    orders = models.IntegerField(
+        default=0,
+        verbose_name='Заказов'
+    )
+    quantity = models.IntegerField(
+        default=0,
+        verbose_name='Букетов'
+    )
+    revenue = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name='Выручка'
+    )
+
+    class Meta:
+        verbose_name = 'Продажи букета за день'
+        verbose_name_plural = 'Продажи букетов по дням'
+        unique_together = ['date', 'product']
+
+
+class DailyOccasionSales(models.Model):
+    date = models.DateField(
+        verbose_name='Дата'
+    )
+    occasion = models.ForeignKey(
+        Occasion,
+        on_delete=models.CASCADE,
+        verbose_name='Повод',
+        related_name='daily_sales'
+    )
+    orders = models.IntegerField(
+        default=0,
+        verbose_name='Заказов'
+    )
+    revenue = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name='Выручка'
+    )
+
+    class Meta:
+        verbose_name = 'Продажи по поводу за день'
+        verbose_name_plural = 'Продажи по поводам по дням'
+        unique_together = ['date', 'occasion']
+
+
+class DailyCourierSales(models.Model):
+    date = models.DateField(
+        verbose_name='Дата доставки'
+    )
+    courier = models.ForeignKey(
+        Courier,
+        on_delete=models.CASCADE,
+        verbose_name='Курьер',
+        related_name='daily_sales'
+    )
+    orders = models.IntegerField(
+        default=0,
+        verbose_name='Заказов'
+    )
+    revenue = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name='Выручка'
+    )
+
+    class Meta:
+        verbose_name = 'Заказы курьера за день'
+        verbose_name_plural = 'Заказы курьеров по дням'
+        unique_together = ['date', 'courier']
+
+
+class GeocodedAddress(models.Model):
+    address = models.TextField(
+        verbose_name='Адрес'
+    )
+    # Уникальность по хэшу: адрес доставки — TextField любой длины, а B-tree индекс по длинному тексту не строится
+    address_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        editable=False,
+        verbose_name='Хэш адреса'
+    )
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Широта'
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Долгота'
+    )
+    provider = models.CharField(
+        max_length=50,
+        blank=True,
+        verbose_name='Источник'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Обновлено'
+    )
+
+    class Meta:
+        verbose_name = 'Координаты адреса'
+        verbose_name_plural = 'Координаты адресов'
+
+    def __str__(self):
+        return self.address
+
+    @staticmethod
+    def hash_address(address):
+        return hashlib.sha256(address.encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.address_hash = self.hash_address(self.address)
+        if kwargs.get('update_fields') is not None and 'address' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'address_hash'}
+        super().save(*args, **kwargs)
+
+    @property
+    def point(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+
 class ConsultationRequest(models.Model):
     class RequestStatus(models.TextChoices):
         NEW = 'new', 'Новая'
@@ -312,6 +566,7 @@ class ConsultationRequest(models.Model):
     customer_phone = PhoneNumberField(
         max_length=20,
         verbose_name='Телефон клиента',
+        db_index=True,
         region='RU'
     )
     comment = models.TextField(
@@ -359,6 +614,16 @@ class ConsultationRequest(models.Model):
         verbose_name = 'Заявка на консультацию'
         verbose_name_plural = 'Заявки на консультацию'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['status', '-created_at'],
+                name='consultation_status_idx'
+            ),
+            models.Index(
+                fields=['-created_at'],
+                name='consultation_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'Консультация #{self.id} - {self.customer_name} ({self.status})'
@@ -0,0 +1,101 @@
+import random
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import replicas
+from .models import Occasion, Product, ProductOccasion
+
+INDEX_VERSION_KEY = 'quiz:index:version'
+INDEX_KEY = 'quiz:index:{version}'
+INDEX_TIMEOUT = 60 * 60 * 24
+
+ANY = 'any'
+
+# Индекс текущей версии в памяти процесса, чтобы не распаковывать его из кэша на каждый запрос
+_local_index = (None, None)
+
+PRICE_RANGES = {
+    'low': 'До 1000',
+    'medium': '1000 - 5000',
+    'high': 'От 5000',
+}
+
+
+def get_price_range(price):
+    if price <= 1000:
+        return 'low'
+    if price <= 5000:
+        return 'medium'
+    return 'high'
+
+
+# Те же границы, что в get_price_range, для фильтрации в SQL
+PRICE_RANGE_FILTERS = {
+    'low': Q(price__lte=1000),
+    'medium': Q(price__gt=1000, price__lte=5000),
+    'high': Q(price__gt=5000),
+}
+
+
+def get_index_version():
+    # Начальная версия — текущее время: если ключ версии вытеснят из кэша,
+    # новая версия не совпадёт со старой и не подхватит устаревшие записи
+    return cache.get_or_set(INDEX_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_index_version():
+    try:
+        cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def build_recommendation_index():
+    """Раскладывает id букетов по корзинам (повод, ценовой диапазон); в каждой корзине id отсортированы.
+
+    Квиз присылает название повода из справочника. Как раньше icontains, оно подходит и к поводам,
+    в названии которых содержится («Свадьба» — к «Серебряной свадьбе»), поэтому такие букеты
+    кладутся в корзину этого повода заранее, а не при каждом выборе.
+    """
+    names = {name.lower() for name in Occasion.objects.values_list('name', flat=True)}
+    occasions = defaultdict(set)
+    for product_id, occasion_name in ProductOccasion.objects.values_list('product_id', 'occasion__name'):
+        occasion_name = occasion_name.lower()
+        occasions[product_id].update(name for name in names if name in occasion_name)
+
+    index = defaultdict(list)
+    for product_id, price in Product.objects.order_by('id').values_list('id', 'price'):
+        for occasion in [*occasions[product_id], ANY]:
+            for price_range in (get_price_range(price), ANY):
+                index[(occasion, price_range)].append(product_id)
+    return dict(index)
+
+
+def get_recommendation_index():
+    global _local_index
+    version = get_index_version()
+    local_version, index = _local_index
+    if local_version == version:
+        return index
+
+    key = INDEX_KEY.format(version=version)
+    index = cache.get(key)
+    if index is None:
+        with replicas.primary():
+            index = build_recommendation_index()
+        cache.set(key, index, INDEX_TIMEOUT)
+    _local_index = (version, index)
+    return index
+
+
+def pick_bouquet_id(occasion, price_range):
+    """Случайный id букета для ответов квиза или None, если подходящих нет; повод — без учёта регистра"""
+    occasion = (occasion or ANY).lower()
+    price_range = price_range if price_range in PRICE_RANGES else ANY
+    product_ids = get_recommendation_index().get((occasion, price_range))
+    if not product_ids:
+        return None
+    return random.choice(product_ids)
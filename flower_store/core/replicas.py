@@ -0,0 +1,76 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PIN_COOKIE = 'primary_pin'
+
+current = ContextVar('replica_routing', default=None)
+reading_primary = ContextVar('replica_reading_primary', default=False)
+
+
+class RoutingState:
+    """Куда читать в текущем запросе. replica — выбранная реплика или None, если читать с основной базы;
+    wrote — запрос что-то записал в приложения, которые читаются с реплик"""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+def start(request):
+    """Реплика для запроса: только для GET/HEAD без cookie закрепления и только если реплики настроены"""
+    replica = None
+    if settings.DATABASE_REPLICAS and request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES:
+        replica = random.choice(settings.DATABASE_REPLICAS)
+    state = RoutingState(replica)
+    return state, current.set(state)
+
+
+def finish(state, token, response):
+    """После записи закрепляет клиента за основной базой, чтобы следующие запросы
+    (например, редирект на оплату) не прочитали устаревшие данные с реплики"""
+    current.reset(token)
+    if state.wrote:
+        response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+
+
+@contextmanager
+def primary():
+    """Внутри блока всё читается с основной базы. Так пересобираются кэши каталога: версия сбрасывается
+    сигналом при записи в основную базу, и данные отстающей реплики попали бы в кэш под новой версией"""
+    token = reading_primary.set(True)
+    try:
+        yield
+    finally:
+        reading_primary.reset(token)
+
+
+class ReplicaRouter:
+    """Чтение моделей из DATABASE_REPLICA_APPS в запросах витрины идёт на реплику, всё остальное — на default.
+
+    Вне запросов (команды, воркеры), после первой записи в запросе и внутри primary() чтение идёт с основной базы.
+    """
+
+    def _routed(self, model):
+        return model._meta.app_label in settings.DATABASE_REPLICA_APPS
+
+    def db_for_read(self, model, **hints):
+        state = current.get()
+        if state and state.replica and not reading_primary.get() and self._routed(model):
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = current.get()
+        if state and self._routed(model):
+            state.replica = None
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,131 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (DailyCourierSales, DailyOccasionSales, DailyProductSales,
+                     Order, ProductOccasion)
+
+SOLD_STATUSES = (Order.OrderStatus.PAID, Order.OrderStatus.ASSIGNED, Order.OrderStatus.DELIVERED)
+ROW_FIELDS = ('created_at', 'product_id', 'courier_id', 'delivery_date', 'quantity', 'total_price', 'status')
+
+
+def order_row(order):
+    return {field: getattr(order, field) for field in ROW_FIELDS}
+
+
+def contribution(row):
+    """Вклад заказа в отчёты или None, если заказ не считается продажей"""
+    if not row or row['status'] not in SOLD_STATUSES:
+        return None
+    return (
+        timezone.localdate(row['created_at']),
+        row['product_id'],
+        row['courier_id'],
+        row['delivery_date'],
+        row['quantity'],
+        row['total_price'],
+    )
+
+
+def _bump(model, lookup, orders, revenue, **extra):
+    model.objects.get_or_create(**lookup)
+    model.objects.filter(**lookup).update(
+        orders=F('orders') + orders,
+        revenue=F('revenue') + revenue,
+        **{field: F(field) + value for field, value in extra.items()},
+    )
+
+
+def apply_changes(changes):
+    """Применяет к отчётам список пар (строка заказа до, строка заказа после)"""
+    by_product = defaultdict(lambda: [0, 0, Decimal(0)])
+    by_courier = defaultdict(lambda: [0, Decimal(0)])
+
+    for before, after in changes:
+        for row, sign in ((contribution(before), -1), (contribution(after), 1)):
+            if not row:
+                continue
+            date, product_id, courier_id, delivery_date, quantity, revenue = row
+            totals = by_product[(date, product_id)]
+            totals[0] += sign
+            totals[1] += sign * quantity
+            totals[2] += sign * revenue
+            if courier_id:
+                totals = by_courier[(delivery_date, courier_id)]
+                totals[0] += sign
+                totals[1] += sign * revenue
+
+    by_product = {key: value for key, value in by_product.items() if any(value)}
+    by_courier = {key: value for key, value in by_courier.items() if any(value)}
+    if not by_product and not by_courier:
+        return
+
+    occasions = defaultdict(list)
+    product_ids = {product_id for _, product_id in by_product}
+    for product_id, occasion_id in ProductOccasion.objects.filter(
+        product_id__in=product_ids
+    ).values_list('product_id', 'occasion_id'):
+        occasions[product_id].append(occasion_id)
+
+    by_occasion = defaultdict(lambda: [0, Decimal(0)])
+    with transaction.atomic():
+        for (date, product_id), (orders, quantity, revenue) in by_product.items():
+            _bump(DailyProductSales, {'date': date, 'product_id': product_id}, orders, revenue, quantity=quantity)
+            for occasion_id in occasions[product_id]:
+                totals = by_occasion[(date, occasion_id)]
+                totals[0] += orders
+                totals[1] += revenue
+        for (date, occasion_id), (orders, revenue) in by_occasion.items():
+            _bump(DailyOccasionSales, {'date': date, 'occasion_id': occasion_id}, orders, revenue)
+        for (date, courier_id), (orders, revenue) in by_courier.items():
+            _bump(DailyCourierSales, {'date': date, 'courier_id': courier_id}, orders, revenue)
+
+
+def rebuild():
+    """Пересобирает отчёты целиком по таблице заказов"""
+    sold = Order.objects.filter(status__in=SOLD_STATUSES).order_by()
+    day = TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+    totals = {'orders': Count('id'), 'revenue': Sum('total_price')}
+
+    with transaction.atomic():
+        DailyProductSales.objects.all().delete()
+        DailyOccasionSales.objects.all().delete()
+        DailyCourierSales.objects.all().delete()
+
+        DailyProductSales.objects.bulk_create(
+            DailyProductSales(**row)
+            for row in sold.values('product_id', date=day).annotate(quantity=Sum('quantity'), **totals)
+        )
+        DailyOccasionSales.objects.bulk_create(
+            DailyOccasionSales(**row)
+            for row in sold.filter(product__productoccasion__isnull=False).values(
+                date=day, occasion_id=F('product__productoccasion__occasion_id')
+            ).annotate(**totals)
+        )
+        DailyCourierSales.objects.bulk_create(
+            DailyCourierSales(**row)
+            for row in sold.filter(courier__isnull=False).values(
+                'courier_id', date=F('delivery_date')
+            ).annotate(**totals)
+        )
+
+
+def sales_report(start, end):
+    """Сводка продаж за период [start, end]; читает только таблицы отчётов"""
+    period = {'date__gte': start, 'date__lte': end}
+    totals = {'orders': Sum('orders'), 'revenue': Sum('revenue')}
+
+    return {
+        'days': DailyProductSales.objects.filter(**period)
+        .values('date').annotate(quantity=Sum('quantity'), **totals).order_by('date'),
+        'products': DailyProductSales.objects.filter(**period)
+        .values('product__name').annotate(quantity=Sum('quantity'), **totals).order_by('-revenue'),
+        'occasions': DailyOccasionSales.objects.filter(**period)
+        .values('occasion__name').annotate(**totals).order_by('-orders'),
+        'couriers': DailyCourierSales.objects.filter(**period)
+        .values('courier__name').annotate(**totals).order_by('-orders'),
+    }
@@ -0,0 +1,229 @@
+import logging
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from itertools import groupby
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .metrics import track
+from .models import GeocodedAddress, Order
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+GEOCODER_TIMEOUT = (3.05, 10)
+SLOT_ORDER = [choice for choice, _ in Order.CHOICE]
+
+
+def normalize_address(address):
+    return re.sub(r'\s+', ' ', address).strip().lower()
+
+
+class OfflineGeocoder:
+    """Ничего не запрашивает: координаты есть только у адресов, уже заполненных в таблице"""
+
+    name = 'offline'
+
+    def geocode(self, address):
+        return None
+
+
+class NominatimGeocoder:
+    """Геокодер OpenStreetMap; по правилам сервиса не чаще одного запроса в секунду"""
+
+    name = 'nominatim'
+    delay = 1.0
+
+    def __init__(self, url=None, session=None):
+        self.url = url or settings.GEOCODER_URL
+        self.session = session or requests.Session()
+        self.session.headers['User-Agent'] = 'flower-store-routing'
+        self._last_request = 0.0
+
+    def geocode(self, address):
+        time.sleep(max(0.0, self._last_request + self.delay - time.monotonic()))
+        self._last_request = time.monotonic()
+        with track('http'):
+            response = self.session.get(
+                self.url,
+                params={'q': address, 'format': 'json', 'limit': 1},
+                timeout=GEOCODER_TIMEOUT,
+            )
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+def get_geocoder():
+    return import_string(settings.GEOCODER)()
+
+
+def geocode_addresses(addresses, geocoder=None):
+    """Координаты адресов: сначала из таблицы, недостающие — у геокодера с сохранением в таблицу.
+
+    Возвращает {адрес: (широта, долгота) или None}. Ненайденные адреса тоже сохраняются,
+    чтобы их можно было заполнить вручную в админке.
+    """
+    geocoder = geocoder or get_geocoder()
+    keys = {address: normalize_address(address) for address in addresses}
+    hashes = {GeocodedAddress.hash_address(key): key for key in set(keys.values())}
+    known = {
+        hashes[row.address_hash]: row
+        for row in GeocodedAddress.objects.filter(address_hash__in=hashes)
+    }
+
+    for key in set(keys.values()):
+        row = known.get(key)
+        if row and (row.point or row.provider == geocoder.name):
+            continue
+        try:
+            point = geocoder.geocode(key)
+        except requests.RequestException as error:
+            logger.warning('Не удалось получить координаты адреса %r: %s', key, error)
+            continue
+        latitude, longitude = point or (None, None)
+        known[key], _ = GeocodedAddress.objects.update_or_create(
+            address_hash=GeocodedAddress.hash_address(key),
+            defaults={'address': key, 'latitude': latitude, 'longitude': longitude, 'provider': geocoder.name},
+        )
+
+    return {address: known[key].point if key in known else None for address, key in keys.items()}
+
+
+def distance_matrix(points):
+    """Попарные расстояния по поверхности Земли в км; тригонометрия по каждой точке считается один раз"""
+    radians = [(math.radians(lat), math.radians(lon)) for lat, lon in points]
+    cos_lat = [math.cos(lat) for lat, _ in radians]
+    size = len(points)
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        lat_i, lon_i = radians[i]
+        for j in range(i + 1, size):
+            lat_j, lon_j = radians[j]
+            a = math.sin((lat_j - lat_i) / 2) ** 2 + cos_lat[i] * cos_lat[j] * math.sin((lon_j - lon_i) / 2) ** 2
+            matrix[i][j] = matrix[j][i] = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+    return matrix
+
+
+def nearest_neighbour(matrix, start=0):
+    """Маршрут из start: каждый раз едем к ближайшей ещё не посещённой точке"""
+    route = [start]
+    left = set(range(len(matrix))) - {start}
+    while left:
+        current = matrix[route[-1]]
+        nearest = min(left, key=current.__getitem__)
+        route.append(nearest)
+        left.remove(nearest)
+    return route
+
+
+def two_opt(route, matrix):
+    """Улучшает незамкнутый маршрут разворотами участков, пока они сокращают путь; первая точка остаётся на месте"""
+    route = list(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(route) - 1):
+            for j in range(i + 1, len(route)):
+                a, b, c = route[i - 1], route[i], route[j]
+                d = route[j + 1] if j + 1 < len(route) else None
+                before = matrix[a][b] + (matrix[c][d] if d is not None else 0)
+                after = matrix[a][c] + (matrix[b][d] if d is not None else 0)
+                if after < before - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+    return route
+
+
+def route_length(route, matrix):
+    return sum(matrix[a][b] for a, b in zip(route, route[1:]))
+
+
+@dataclass
+class Manifest:
+    courier: object
+    date: object
+    stops: list = field(default_factory=list)
+    unlocated: list = field(default_factory=list)
+    distance_km: float = 0.0
+
+    @property
+    def deliveries(self):
+        return len(self.stops) + len(self.unlocated)
+
+    @property
+    def hours(self):
+        """Оценка времени на маршрут: дорога плюс время на каждую доставку"""
+        return self.distance_km / settings.COURIER_SPEED_KMH + self.deliveries * settings.DELIVERY_STOP_MINUTES / 60
+
+    @property
+    def deliveries_per_hour(self):
+        return self.deliveries / self.hours if self.hours else 0.0
+
+
+def plan_routes(date, geocoder=None):
+    """Маршрутные листы курьеров на день.
+
+    Заказы курьера идут по слотам доставки; внутри слота остановки упорядочены
+    ближайшим соседом с улучшением 2-opt, начиная с точки, где закончился предыдущий слот
+    (для первого слота — с магазина). Заказы без координат попадают в unlocated.
+    """
+    orders = list(
+        Order.objects.filter(
+            delivery_date=date,
+            status__in=Order.ACTIVE_STATUSES,
+            courier__isnull=False,
+        ).select_related('courier', 'product')
+    )
+    orders.sort(key=lambda order: (order.courier_id, SLOT_ORDER.index(order.delivery_time), order.id))
+    points = geocode_addresses({order.delivery_address for order in orders}, geocoder)
+
+    manifests = []
+    for _, courier_orders in groupby(orders, key=lambda order: order.courier_id):
+        courier_orders = list(courier_orders)
+        manifest = Manifest(courier=courier_orders[0].courier, date=date)
+        position = settings.SHOP_LOCATION
+        for _, slot_orders in groupby(courier_orders, key=lambda order: order.delivery_time):
+            located = []
+            for order in slot_orders:
+                if points[order.delivery_address]:
+                    located.append(order)
+                else:
+                    manifest.unlocated.append(order)
+            if not located:
+                continue
+
+            matrix = distance_matrix([position] + [points[order.delivery_address] for order in located])
+            route = two_opt(nearest_neighbour(matrix), matrix)
+            manifest.stops.extend(located[index - 1] for index in route[1:])
+            manifest.distance_km += route_length(route, matrix)
+            position = points[manifest.stops[-1].delivery_address]
+        manifests.append(manifest)
+    return manifests
+
+
+def format_manifest(manifest):
+    lines = [
+        f"🗺 Маршрут на {manifest.date}",
+        f"Курьер: {manifest.courier.name}",
+        f"Доставок: {manifest.deliveries}, около {manifest.distance_km:.1f} км, {manifest.hours:.1f} ч",
+        "",
+    ]
+    for number, order in enumerate(manifest.stops, 1):
+        lines.append(
+            f"{number}. [{order.get_delivery_time_display()}] {order.delivery_address} — "
+            f"{order.customer_name}, {order.customer_phone}, {order.product} × {order.quantity}"
+        )
+    if manifest.unlocated:
+        lines += ["", "Адреса без координат:"]
+        lines += [
+            f"• [{order.get_delivery_time_display()}] {order.delivery_address} — {order.customer_name}, {order.customer_phone}"
+            for order in manifest.unlocated
+        ]
+    return "\n".join(lines)
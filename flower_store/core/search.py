@@ -0,0 +1,103 @@
+import re
+
+import phonenumbers
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+SEARCH_CONFIG = 'russian'
+PHONE_RE = re.compile(r'^[\d\s()+\-]{7,}$')
+
+# Выражения совпадают с индексами из миграции 0006_search_indexes, иначе Postgres их не использует.
+# Документ заказа подставляется в подзапрос search_orders, где у core_order свой псевдоним,
+# поэтому столбцы в нём без имени таблицы
+ORDER_DOCUMENT = '"customer_name" || \' \' || "delivery_address"'
+PRODUCT_DOCUMENT = '"core_product"."name" || \' \' || "core_product"."first_description"'
+
+
+def normalize_phone(term):
+    """Телефон в формате E.164 (+79991234567), если term — полный номер, иначе None"""
+    if not PHONE_RE.match(term):
+        return None
+    try:
+        number = phonenumbers.parse(term, 'RU')
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(number):
+        return None
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def phone_filter(term, field='customer_phone'):
+    """Точное совпадение для полного номера, поиск по цифрам для части номера; None, если term не похож на телефон.
+
+    Часть номера (не короче 7 символов, см. PHONE_RE) ищется через LIKE '%...%' по trigram-индексу
+    из миграции 0012_phone_trigram_indexes на Postgres; на SQLite это полный просмотр.
+    """
+    if not PHONE_RE.match(term):
+        return None
+    phone = normalize_phone(term)
+    if phone:
+        return Q(**{field: phone})
+    digits = re.sub(r'\D', '', term)
+    condition = Q(**{f'{field}__contains': digits})
+    if term.startswith('8'):
+        # 8 в начале — российский префикс, в базе номер хранится как +7...
+        condition |= Q(**{f'{field}__startswith': f'+7{digits[1:]}'})
+    return condition
+
+
+def full_text(document, term):
+    return RawSQL(
+        f"to_tsvector('{SEARCH_CONFIG}', {document}) @@ plainto_tsquery('{SEARCH_CONFIG}', %s)",
+        [term],
+        output_field=BooleanField(),
+    )
+
+
+def text_filter(fields, term, document=None):
+    """Подстрока по полям (pg_trgm-индексы на Postgres) или полнотекстовое совпадение по document"""
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': term})
+    if document and connection.vendor == 'postgresql':
+        condition |= Q(full_text(document, term))
+    return condition
+
+
+def search_orders(queryset, term):
+    """Поиск заказов по телефону, имени и адресу клиента или названию букета.
+
+    Букеты ищутся отдельным подзапросом и объединяются через UNION: условие по JOIN
+    в одном OR с полями core_order не даёт Postgres использовать индексы core_order.
+    """
+    term = term.strip()
+    if not term:
+        return queryset
+    phone = phone_filter(term)
+    if phone:
+        return queryset.filter(phone)
+
+    orders = queryset.model._default_manager.order_by()
+    by_order = orders.filter(text_filter(['customer_name', 'delivery_address'], term, ORDER_DOCUMENT))
+    by_product = orders.filter(product__in=Product.objects.filter(text_filter(['name'], term)).order_by())
+    return queryset.filter(pk__in=by_order.values('pk').union(by_product.values('pk')))
+
+
+def search_products(queryset, term):
+    term = term.strip()
+    if not term:
+        return queryset
+    return queryset.filter(text_filter(['name', 'first_description'], term, PRODUCT_DOCUMENT))
+
+
+def search_consultations(queryset, term):
+    term = term.strip()
+    if not term:
+        return queryset
+    phone = phone_filter(term)
+    if phone:
+        return queryset.filter(phone)
+    return queryset.filter(text_filter(['customer_name'], term))
@@ -0,0 +1,149 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .couriers import change_load
+from .fragment_cache import bump_catalog_version
+from .images import process_product_image
+from .metrics import install_query_recorder
+from .models import (Flower, Occasion, Order, Product,
+                     ProductFlowerComposition, ProductOccasion)
+from .recommendations import bump_index_version
+from .rollups import apply_changes, order_row
+from .slots import release_slot, reserve_slot
+from .transitions import notify_status_changed
+
+
+def refresh_products(product_ids):
+    for product in Product.objects.filter(pk__in=product_ids):
+        product.refresh_composition_display()
+
+
+@receiver(post_save, sender=ProductFlowerComposition)
+@receiver(post_delete, sender=ProductFlowerComposition)
+def composition_changed(sender, instance: ProductFlowerComposition, origin=None, **kwargs):
+    # При каскадном удалении букета пересчитывать нечего, а цветка — пересчитает flower_deleted
+    if origin is not None and not isinstance(origin, ProductFlowerComposition) \
+            and getattr(origin, 'model', None) is not ProductFlowerComposition:
+        return
+    refresh_products([instance.product_id])
+
+
+@receiver(pre_save, sender=Flower)
+def remember_flower_name(sender, instance: Flower, update_fields=None, **kwargs):
+    instance._previous_name = None
+    if instance.pk and (update_fields is None or 'name' in update_fields):
+        instance._previous_name = Flower.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Flower)
+def flower_renamed(sender, instance: Flower, created, **kwargs):
+    previous = getattr(instance, '_previous_name', None)
+    if created or previous is None or previous == instance.name:
+        return
+    refresh_products(
+        ProductFlowerComposition.objects.filter(flower=instance).values_list('product_id', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=Flower)
+def remember_flower_products(sender, instance: Flower, **kwargs):
+    instance._product_ids = list(
+        ProductFlowerComposition.objects.filter(flower=instance).values_list('product_id', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Flower)
+def flower_deleted(sender, instance: Flower, **kwargs):
+    refresh_products(getattr(instance, '_product_ids', []))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductOccasion)
+@receiver(post_delete, sender=ProductOccasion)
+@receiver(post_save, sender=Occasion)
+@receiver(post_delete, sender=Occasion)
+@receiver(post_save, sender=ProductFlowerComposition)
+@receiver(post_delete, sender=ProductFlowerComposition)
+@receiver(post_save, sender=Flower)
+@receiver(post_delete, sender=Flower)
+def catalog_changed(sender, **kwargs):
+    bump_index_version()
+    bump_catalog_version()
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_state(sender, instance: Order, **kwargs):
+    instance._previous_load_key = None
+    instance._previous_slot_key = None
+    instance._previous_sales_row = None
+    instance._previous_status = None
+    if instance.pk:
+        previous = Order.objects.filter(pk=instance.pk).first()
+        if previous:
+            instance._previous_status = previous.status
+            instance._previous_load_key = previous.load_key
+            instance._previous_slot_key = previous.slot_key
+            instance._previous_sales_row = order_row(previous)
+
+
+@receiver(post_save, sender=Order)
+def update_courier_load(sender, instance: Order, **kwargs):
+    previous, current = getattr(instance, '_previous_load_key', None), instance.load_key
+    if previous == current:
+        return
+    if previous:
+        change_load(previous, -1)
+    if current:
+        change_load(current, 1)
+    instance._previous_load_key = current
+
+
+@receiver(post_save, sender=Order)
+def update_delivery_slot(sender, instance: Order, created, **kwargs):
+    previous, current = getattr(instance, '_previous_slot_key', None), instance.slot_key
+    if created and getattr(instance, '_slot_reserved', False):
+        previous = current
+    if previous != current:
+        if previous:
+            release_slot(*previous)
+        if current:
+            reserve_slot(*current, force=True)
+    instance._previous_slot_key = current
+
+
+@receiver(post_save, sender=Order)
+def order_saved_with_new_status(sender, instance: Order, created, **kwargs):
+    previous = getattr(instance, '_previous_status', None)
+    if not created and previous and previous != instance.status:
+        notify_status_changed(instance, previous)
+    instance._previous_status = instance.status
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance: Order, **kwargs):
+    current = order_row(instance)
+    apply_changes([(getattr(instance, '_previous_sales_row', None), current)])
+    instance._previous_sales_row = current
+
+
+@receiver(post_delete, sender=Order)
+def release_courier_load(sender, instance: Order, **kwargs):
+    if instance.load_key:
+        change_load(instance.load_key, -1)
+    if instance.slot_key:
+        release_slot(*instance.slot_key)
+    apply_changes([(order_row(instance), None)])
+
+
+@receiver(post_save, sender=Product)
+def product_image_uploaded(sender, instance: Product, **kwargs):
+    if instance.image and instance.image.name != instance.image_variants.get('source'):
+        process_product_image(instance)
+        bump_catalog_version()
+
+
+@receiver(connection_created)
+def record_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import DeliverySlot, Order
+
+
+def _take(delivery_date, delivery_time, force):
+    slots = DeliverySlot.objects.filter(delivery_date=delivery_date, delivery_time=delivery_time)
+    if not force:
+        slots = slots.filter(reserved__lt=F('capacity'))
+    return slots.update(reserved=F('reserved') + 1) == 1
+
+
+def reserve_slot(delivery_date, delivery_time, force=False):
+    """Бронирует место в слоте одним условным UPDATE; False, если слот заполнен.
+
+    force=True бронирует сверх вместимости (изменения из админки).
+    """
+    if _take(delivery_date, delivery_time, force):
+        return True
+    DeliverySlot.objects.get_or_create(
+        delivery_date=delivery_date,
+        delivery_time=delivery_time,
+        defaults={'capacity': settings.DELIVERY_SLOT_CAPACITY},
+    )
+    return _take(delivery_date, delivery_time, force)
+
+
+def release_slot(delivery_date, delivery_time, count=1):
+    DeliverySlot.objects.filter(
+        delivery_date=delivery_date,
+        delivery_time=delivery_time,
+        reserved__gte=count,
+    ).update(reserved=F('reserved') - count)
+
+
+def get_availability(start, days):
+    """Свободные места по дням и слотам, только из счётчиков"""
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    slots = {
+        (slot.delivery_date, slot.delivery_time): slot
+        for slot in DeliverySlot.objects.filter(delivery_date__range=(dates[0], dates[-1]))
+    }
+    availability = []
+    for date in dates:
+        day = []
+        for value, label in Order.CHOICE:
+            slot = slots.get((date, value))
+            day.append({
+                'value': value,
+                'label': label,
+                'available': slot.available if slot else settings.DELIVERY_SLOT_CAPACITY,
+            })
+        availability.append({'date': date, 'slots': day})
+    return availability
@@ -0,0 +1,33 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.fragment_cache import get_or_render
+
+register = template.Library()
+
+
+class CatalogCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return mark_safe(get_or_render(self.name, vary_on, lambda: self.nodelist.render(context)))
+
+
+@register.tag
+def catalog_cache(parser, token):
+    """
+    Кэширует фрагмент до следующего изменения каталога:
+
+        {% catalog_cache "bouquet" bouquet.id %} ... {% endcatalog_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least 1 argument.")
+    nodelist = parser.parse(('endcatalog_cache',))
+    parser.delete_first_token()
+    name = bits[1].strip('"\'')
+    return CatalogCacheNode(nodelist, name, [parser.compile_filter(bit) for bit in bits[2:]])
@@ -0,0 +1,61 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from core.images import MIME_TYPES
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 600px) 100vw, (max-width: 1200px) 50vw, 33vw'
+
+
+def get_srcset(variants):
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in sorted(variants.items(), key=lambda item: int(item[0]))
+    )
+
+
+@register.simple_tag
+def product_image_url(product, width=None):
+    """URL самой маленькой копии фото не уже width, иначе оригинала"""
+    variants = product.image_variants.get('jpeg')
+    if not variants:
+        return product.image.url if product.image else ''
+    widths = sorted(int(w) for w in variants)
+    if width is not None:
+        widths = [w for w in widths if w >= int(width)] or widths[-1:]
+    return default_storage.url(variants[str(widths[0])])
+
+
+@register.simple_tag
+def product_picture(product, css_class='', sizes=DEFAULT_SIZES, loading='lazy'):
+    """<picture> с avif/webp/jpeg srcset, браузер сам выбирает нужный размер"""
+    if not product.image:
+        return ''
+    variants = product.image_variants
+    if not variants.get('jpeg'):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">',
+            product.image.url, product.name, css_class, loading,
+        )
+
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[format_name], get_srcset(variants[format_name]), sizes)
+            for format_name in ('avif', 'webp')
+            if variants.get(format_name)
+        ),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}"></picture>',
+        sources,
+        product_image_url(product, 640),
+        get_srcset(variants['jpeg']),
+        sizes,
+        product.name,
+        css_class,
+        loading,
+    )
@@ -0,0 +1,26 @@
+from django.template.backends.django import DjangoTemplates
+
+from .metrics import track
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        with track('templates'):
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Обычный бэкенд шаблонов Django, который учитывает время рендера в метриках запроса"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
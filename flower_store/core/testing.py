@@ -0,0 +1,27 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """manage.py test с отдельным файловым кэшем во временном каталоге.
+
+    Тесты очищают кэш (cache.clear()) и пишут в него версии каталога тестовой базы,
+    поэтому общий кэш работающего магазина им не достаётся.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix='flower_store_tests_')
+        self.cache_settings = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': self.cache_dir,
+        }})
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
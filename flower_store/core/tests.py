@@ -1,3 +1,1179 @@
-from django.test import TestCase
+import csv
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib import admin as admin_site
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from bot.models import TelegramMessage
+from payments.models import PaymentEvent
+from payments.processing import process_pending
+
+from . import (admission, benchmark, checks, facets, fragment_cache, funnel, images, metrics, recommendations,
+               replicas, rollups, routing, signals, views)
+from .couriers import assign_courier
+from .middleware import AdmissionMiddleware, FunnelMiddleware, ReplicaMiddleware, RequestMetricsMiddleware
+from .models import (ConsultationRequest, Courier, CourierLoad, DailyCourierSales, DailyOccasionSales,
+                     DailyProductSales, DeliverySlot, Florist, Flower, GeocodedAddress, Occasion, Order, Product,
+                     ProductFlowerComposition, ProductOccasion)
+from .recommendations import pick_bouquet_id
+from .search import search_orders
+from .transitions import bulk_set_status, cancel_unpaid_orders, transition
+
+
+@override_settings(CLOUDPAYMENTS_API_SECRET=benchmark.PAYMENT_SECRET)
+class StorefrontFunnelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(products=30, orders=100, consultations=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_funnel_replays_every_step(self):
+        samples = benchmark.replay(2)
+
+        self.assertEqual(
+            list(samples),
+            [
+                'index', 'catalog', 'quiz_step_1', 'quiz_step_2', 'bouquet_item',
+                'order_step_delivery', 'order_step_delivery_post', 'payments_pay',
+                'payments_success', 'payments_webhook', 'consultation', 'consultation_post',
+            ],
+        )
+
+    def test_compare_reports_query_regressions(self):
+        report = {'index': {'p50_ms': 1, 'p95_ms': 2, 'queries': 3, 'alloc_kb': 10}}
+        baseline = {'index': {'p50_ms': 1, 'p95_ms': 2, 'queries': 2, 'alloc_kb': 10}}
+
+        self.assertEqual(len(benchmark.compare(report, baseline, tolerance=0.5)), 1)
+        self.assertEqual(benchmark.compare(report, report, tolerance=0.5), [])
+
+
+class AsyncStorefrontTests(TestCase):
+    """Витрина через асинхронный стек (как под uvicorn): без синхронного ORM в event loop"""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(products=10, orders=20, consultations=0)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_storefront_views(self):
+        bouquet = await Product.objects.afirst()
+        for url in ['/', '/catalog/', f'/bouquet/{bouquet.id}/', '/catalog-collect/', '/quiz-step/']:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    async def test_quiz_keeps_funnel_in_session(self):
+        occasion = await Occasion.objects.afirst()
+
+        response = await self.async_client.post('/quiz-step/', {'occasion': occasion.name, 'price_range': 'any'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual((await (await self.async_client.asession()).aget('order_data'))['order_occasion'], occasion.name)
+
+
+class FunnelStateTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        self.session = self.session_store()
+        self.session[funnel.SESSION_KEY] = {'order_occasion': 'Свадьба'}
+        self.session.save()
+
+    def handle(self, view, cookies=None):
+        request = self.factory.get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = self.session.session_key
+        request.COOKIES.update(cookies or {})
+        middleware = SessionMiddleware(FunnelMiddleware(view))
+        with mock.patch.object(self.session_store, 'save', autospec=True,
+                               side_effect=self.session_store.save) as save:
+            response = middleware(request)
+        return request, response, save.call_count
+
+    def choose_bouquet(self, request):
+        request.funnel.update(order_occasion='Свадьба')
+        request.funnel.update(order_price_range='high')
+        request.funnel.update(bouquet_name='Розы', bouquet_id=1)
+        return HttpResponse()
+
+    def test_session_is_written_once_per_request(self):
+        request, response, saves = self.handle(self.choose_bouquet)
+
+        self.assertEqual(saves, 1)
+        self.assertEqual(request.session[funnel.SESSION_KEY], {
+            'order_occasion': 'Свадьба', 'order_price_range': 'high', 'bouquet_name': 'Розы', 'bouquet_id': 1,
+        })
+
+    def test_unchanged_funnel_is_not_saved(self):
+        def view(request):
+            request.funnel.update(order_occasion=request.funnel.get('order_occasion'))
+            request.funnel.update(order_occasion='Свадьба')
+            return HttpResponse()
+
+        self.assertEqual(self.handle(view)[2], 0)
+
+    @override_settings(FUNNEL_STORAGE='cookie')
+    def test_cookie_storage_round_trip(self):
+        request, response, saves = self.handle(self.choose_bouquet)
+
+        self.assertEqual(saves, 0)
+        self.assertEqual(request.session[funnel.SESSION_KEY], {'order_occasion': 'Свадьба'})
+        cookie = response.cookies[funnel.COOKIE_NAME]
+        self.assertTrue(cookie['httponly'])
+
+        request, response, saves = self.handle(lambda request: HttpResponse(),
+                                               cookies={funnel.COOKIE_NAME: cookie.value})
+        self.assertEqual(request.funnel.get('bouquet_name'), 'Розы')
+        self.assertNotIn(funnel.COOKIE_NAME, response.cookies)
+
+    @override_settings(FUNNEL_STORAGE='cookie')
+    def test_tampered_or_invalid_cookie_is_ignored(self):
+        value = self.handle(self.choose_bouquet)[1].cookies[funnel.COOKIE_NAME].value
+        payload, signature = value.rsplit(':', 1)
+        tampered = f"{payload}:{'A' if signature[0] != 'A' else 'B'}{signature[1:]}"
+
+        for cookie in [tampered, 'garbage', '']:
+            with self.subTest(cookie=cookie):
+                request = self.handle(lambda request: HttpResponse(), cookies={funnel.COOKIE_NAME: cookie})[0]
+                self.assertEqual(request.funnel.data, {})
+
+
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(products=10, orders=20, consultations=0)
+
+    def test_server_timing_counts_view_queries(self):
+        cache.clear()
+
+        response = self.client.get('/catalog/')
+
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'tpl', 'http', 'total'})
+        self.assertNotIn('"0 queries"', timing['db'])
+
+    def test_repeated_queries_are_reported(self):
+        def view(request):
+            for product in Product.objects.all():
+                list(product.orders.all())
+            return HttpResponse()
+
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+
+        self.assertIn('repeated_queries', logs.output[0])
+
+    def test_request_line_is_debug_only(self):
+        with self.assertLogs('core.metrics', 'DEBUG') as logs:
+            self.client.get('/catalog/')
+
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+
+    def test_recorder_survives_connection_opened_inside_execute_wrapper(self):
+        def wrapper(execute, *args):
+            return execute(*args)
+
+        class FakeConnection:
+            execute_wrappers = []
+
+        fake = FakeConnection()
+        # Так выглядит connection.execute_wrapper(wrapper), внутри которого открылось соединение
+        fake.execute_wrappers.append(wrapper)
+        signals.record_queries(sender=None, connection=fake)
+        fake.execute_wrappers.pop()
+
+        self.assertEqual(fake.execute_wrappers, [metrics.record_query])
+        signals.record_queries(sender=None, connection=fake)
+        self.assertEqual(fake.execute_wrappers, [metrics.record_query])
+
+
+class CatalogPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [
+            Product.objects.create(name=f'Букет {number}', first_description='-', price=1000 + number).id
+            for number in range(3 * views.CATALOG_PAGE_SIZE + 2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_cover_catalog_without_duplicates_or_gaps(self):
+        seen = []
+        page = views.get_catalog_page()
+        while True:
+            seen += [bouquet.id for bouquet in page['bouquets']]
+            if not page['next_cursor']:
+                break
+            page = views.get_catalog_page(page['next_cursor'])
+
+        self.assertEqual(seen, self.ids)
+
+    def test_last_page_has_no_next_url(self):
+        url = reverse('core:catalog_more')
+        after = self.ids[-3]
+
+        data = self.client.get(url, {'after': after}).json()
+        self.assertIsNone(data['next_url'])
+        self.assertEqual(data['html'].count('href="/bouquet/'), 2)
+
+        data = self.client.get(url, {'after': self.ids[-1]}).json()
+        self.assertEqual((data['html'].strip(), data['next_url']), ('', None))
+
+    def test_next_url_continues_after_last_bouquet(self):
+        data = self.client.get(reverse('core:catalog_more'), {'after': self.ids[0]}).json()
+
+        self.assertEqual(data['next_url'], f"{reverse('core:catalog_more')}?after={self.ids[views.CATALOG_PAGE_SIZE]}")
+
+    def test_invalid_cursor_is_rejected(self):
+        for after in ['abc', '-1', '1.5', str(2 ** 64)]:
+            with self.subTest(after=after):
+                self.assertEqual(self.client.get(reverse('core:catalog_more'), {'after': after}).status_code, 400)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        birthday = Occasion.objects.create(name='День рождения')
+        wedding = Occasion.objects.create(name='Свадьба')
+        self.cheap = Product.objects.create(name='Ромашки', first_description='-', price=900)
+        self.expensive = Product.objects.create(name='Розы', first_description='-', price=9000)
+        ProductOccasion.objects.create(product=self.cheap, occasion=birthday)
+        ProductOccasion.objects.create(product=self.expensive, occasion=wedding)
+
+    def test_occasion_matches_name_ignoring_case(self):
+        self.assertEqual(pick_bouquet_id('день рождения', 'low'), self.cheap.id)
+        self.assertEqual(pick_bouquet_id('СВАДЬБА', 'any'), self.expensive.id)
+        self.assertIsNone(pick_bouquet_id('День рождения', 'high'))
+        self.assertIn(pick_bouquet_id('any', 'any'), {self.cheap.id, self.expensive.id})
+
+    def test_occasion_covers_occasions_containing_its_name(self):
+        silver = Product.objects.create(name='Лилии', first_description='-', price=9500)
+        ProductOccasion.objects.create(product=silver, occasion=Occasion.objects.create(name='Серебряная свадьба'))
+
+        index = recommendations.get_recommendation_index()
+
+        self.assertEqual(index[('свадьба', 'high')], [self.expensive.id, silver.id])
+        self.assertEqual(index[('серебряная свадьба', 'high')], [silver.id])
+        with self.assertNumQueries(0):
+            self.assertIn(pick_bouquet_id('Свадьба', 'high'), {self.expensive.id, silver.id})
+
+    def test_deleted_bouquet_is_not_picked(self):
+        self.assertEqual(pick_bouquet_id('свадьба', 'high'), self.expensive.id)
+
+        self.expensive.delete()
+
+        self.assertIsNone(pick_bouquet_id('свадьба', 'high'))
+
+    def test_process_local_cache_is_rejected(self):
+        self.assertEqual(checks.shared_cache_check(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([error.id for error in checks.shared_cache_check(None)], ['core.E001'])
+
+
+class FacetedSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(products=30, orders=0, consultations=0)
+
+    def setUp(self):
+        cache.clear()
+        occasions = list(Occasion.objects.values_list('name', flat=True)[:2])
+        flowers = list(Flower.objects.values_list('name', flat=True)[:2])
+        self.selections = [
+            {},
+            {'occasion': occasions[:1]},
+            {'occasion': occasions, 'price_range': ['low', 'high']},
+            {'flower': flowers[:1], 'price_range': ['medium']},
+            {'recommended': [facets.RECOMMENDED], 'occasion': occasions},
+            {'price_range': ['unknown'], 'flower': ['нет такого']},
+            {'occasion': ['any', ''], 'price_range': ['']},
+        ]
+
+    def test_sql_filter_matches_index(self):
+        for selected in self.selections:
+            with self.subTest(selected=selected):
+                search = facets.FacetedSearch(selected)
+                self.assertEqual(
+                    set(search.filter(Product.objects.all()).values_list('id', flat=True)),
+                    search.matching_ids(),
+                )
+
+    def test_catalog_does_not_pass_ids_as_parameters(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/catalog-collect/', {'filtered': '1', 'price_range': ['low', 'medium', 'high']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['bouquets']), Product.objects.count())
+        product_queries = [query['sql'] for query in queries if query['sql'].startswith('SELECT "core_product"."id", "core_product"."name"')]
+        self.assertEqual(len(product_queries), 1)
+        self.assertNotIn(' IN (', product_queries[0])
+
+    def test_index_is_kept_in_process_until_version_changes(self):
+        facets.get_facet_index()
+        with mock.patch.object(facets.cache, 'get', wraps=facets.cache.get) as cache_get:
+            facets.get_facet_index()
+            self.assertEqual([call.args[0] for call in cache_get.call_args_list], [fragment_cache.VERSION_KEY])
+
+            Product.objects.create(name='Новый', first_description='-', price=100)
+            self.assertEqual(len(facets.get_facet_index()['all']), Product.objects.count())
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.renders = []
+
+    def render(self, value):
+        def render():
+            self.renders.append(value)
+            return value
+        return render
+
+    def test_fresh_fragment_is_rendered_once(self):
+        self.assertEqual(fragment_cache.get_or_render('catalog', [1], self.render('a')), 'a')
+        self.assertEqual(fragment_cache.get_or_render('catalog', [1], self.render('b')), 'a')
+        self.assertEqual(fragment_cache.get_or_render('catalog', [2], self.render('c')), 'c')
+        self.assertEqual(self.renders, ['a', 'c'])
+
+    def test_version_bump_is_seen_by_other_workers(self):
+        fragment_cache.get_or_render('catalog', [1], self.render('a'))
+        other_worker = caches.create_connection('default')
+        version = other_worker.get(fragment_cache.VERSION_KEY)
+        self.assertEqual(version, fragment_cache.get_catalog_version())
+
+        Product.objects.create(name='Букет', first_description='-', price=1000)
+
+        self.assertNotEqual(other_worker.get(fragment_cache.VERSION_KEY), version)
+        self.assertEqual(fragment_cache.get_or_render('catalog', [1], self.render('b')), 'b')
+
+    def test_evicted_version_does_not_revive_old_fragments(self):
+        fragment_cache.get_or_render('catalog', [1], self.render('a'))
+        cache.delete(fragment_cache.VERSION_KEY)
+
+        self.assertEqual(fragment_cache.get_or_render('catalog', [1], self.render('b')), 'b')
+
+    @override_settings(CATALOG_CACHE_FRESH=-1)
+    def test_stale_fragment_is_served_while_another_request_rebuilds_it(self):
+        fragment_cache.get_or_render('catalog', [1], self.render('a'))
+        lock_key = fragment_cache.LOCK_KEY.format(name='catalog', vary=fragment_cache.make_vary_key([1]))
+
+        cache.add(lock_key, 1)
+        self.assertEqual(fragment_cache.get_or_render('catalog', [1], self.render('b')), 'a')
+
+        cache.delete(lock_key)
+        self.assertEqual(fragment_cache.get_or_render('catalog', [1], self.render('c')), 'c')
+        self.assertEqual(self.renders, ['a', 'c'])
+        self.assertIsNone(cache.get(lock_key))
+
+
+class CompositionDisplayTests(TestCase):
+    def setUp(self):
+        self.rose = Flower.objects.create(name='Роза')
+        self.products = [
+            Product.objects.create(name=f'Букет {number}', first_description='-', price=1000)
+            for number in range(3)
+        ]
+        for product in self.products:
+            ProductFlowerComposition.objects.create(product=product, flower=self.rose, quantity=5)
+
+    def composition_updates(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        return [query['sql'] for query in queries if 'SET "composition_display"' in query['sql']]
+
+    def test_rebuilt_only_on_rename(self):
+        self.assertEqual(self.composition_updates(self.rose.save), [])
+
+        self.rose.name = 'Пион'
+        self.assertEqual(len(self.composition_updates(self.rose.save)), 3)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).composition_display, 'Пион - 5 шт.')
+
+    def test_cascade_deletes(self):
+        self.assertEqual(self.composition_updates(self.products[0].delete), [])
+        self.assertEqual(len(self.composition_updates(self.rose.delete)), 2)
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).composition_display, '')
+
+
+class ProductImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, image_format, size=(400, 300), mode='RGB', exif=False):
+        image = Image.new(mode, size, (200, 40, 80, 0) if mode == 'RGBA' else (200, 40, 80))
+        options = {}
+        if exif:
+            metadata = Image.Exif()
+            metadata[0x010F] = 'Camera'
+            options['exif'] = metadata
+        buffer = BytesIO()
+        image.save(buffer, image_format, **options)
+        return ContentFile(buffer.getvalue(), name=name)
+
+    def create_product(self, upload, name='Букет'):
+        product = Product.objects.create(name=name, first_description='-', price=1000, image=upload)
+        return Product.objects.get(pk=product.pk)
+
+    def stored_image(self, name):
+        with default_storage.open(name) as file:
+            image = Image.open(file)
+            image.load()
+        return image
+
+    def test_png_keeps_format_and_alpha(self):
+        product = self.create_product(self.upload('rose.png', 'PNG', size=(2400, 600), mode='RGBA', exif=True))
+
+        self.assertTrue(product.image.name.endswith('.png'))
+        image = self.stored_image(product.image.name)
+        self.assertEqual((image.format, image.mode), ('PNG', 'RGBA'))
+        self.assertEqual(max(image.size), images.MAX_DIMENSION)
+        self.assertFalse(image.getexif())
+        self.assertEqual(product.image_variants['source'], product.image.name)
+
+    def test_other_formats_become_jpeg_with_jpg_extension(self):
+        product = self.create_product(self.upload('rose.gif', 'GIF'))
+
+        self.assertTrue(product.image.name.endswith('.jpg'))
+        self.assertEqual(self.stored_image(product.image.name).format, 'JPEG')
+        self.assertFalse(default_storage.exists(product.image.name[:-4] + '.gif'))
+        self.assertEqual(product.image_variants['source'], product.image.name)
+
+    def test_replaced_image_variants_are_deleted(self):
+        product = self.create_product(self.upload('rose.jpg', 'JPEG'))
+        old_variants = [name for fmt in images.FORMATS for name in product.image_variants[fmt].values()]
+        self.assertTrue(all(default_storage.exists(name) for name in old_variants))
+
+        product.image = self.upload('peony.jpg', 'JPEG')
+        product.save()
+
+        self.assertFalse(any(default_storage.exists(name) for name in old_variants))
+        product.refresh_from_db()
+        new_variants = [name for fmt in images.FORMATS for name in product.image_variants[fmt].values()]
+        self.assertTrue(all(default_storage.exists(name) for name in new_variants))
+
+
+    def test_images_with_same_stem_keep_their_own_variants(self):
+        rose_jpg = self.create_product(self.upload('rose.jpg', 'JPEG'))
+        rose_png = self.create_product(self.upload('rose.png', 'PNG'), name='Розы')
+        jpg_variants = [name for fmt in images.FORMATS for name in rose_jpg.image_variants[fmt].values()]
+        png_variants = [name for fmt in images.FORMATS for name in rose_png.image_variants[fmt].values()]
+        self.assertFalse(set(jpg_variants) & set(png_variants))
+
+        rose_png.image = self.upload('rose.png', 'PNG')
+        rose_png.save()
+
+        self.assertTrue(all(default_storage.exists(name) for name in jpg_variants))
+
+
+class CounterRecountMixin:
+    """Счётчики CourierLoad и DeliverySlot сверяются с пересчётом по самим заказам"""
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Букет', first_description='-', price=1000)
+        self.couriers = [
+            Courier.objects.create(name=f'Курьер {number}', phone=f'+7999000000{number}')
+            for number in range(2)
+        ]
+        self.today = timezone.localdate()
+
+    def make_order(self, **fields):
+        fields = {
+            'customer_name': 'Клиент', 'customer_phone': '+79990000009', 'delivery_address': 'Адрес',
+            'delivery_date': self.today, 'delivery_time': '10-12', 'product': self.product, **fields,
+        }
+        return Order.objects.create(**fields)
+
+    def assertCountersMatchRecount(self):
+        loads = Counter()
+        slots = Counter()
+        for order in Order.objects.all():
+            if order.load_key:
+                loads[order.load_key] += 1
+            if order.slot_key:
+                slots[order.slot_key] += 1
+        self.assertEqual(
+            {(load.courier_id, load.delivery_date, load.delivery_time): load.orders
+             for load in CourierLoad.objects.filter(orders__gt=0)},
+            dict(loads),
+        )
+        self.assertEqual(
+            {(slot.delivery_date, slot.delivery_time): slot.reserved for slot in DeliverySlot.objects.filter(reserved__gt=0)},
+            dict(slots),
+        )
+
+
+class CourierLoadTests(CounterRecountMixin, TestCase):
+    def test_reassignment_moves_load(self):
+        order = self.make_order(status=Order.OrderStatus.ASSIGNED, courier=self.couriers[0])
+        self.assertCountersMatchRecount()
+
+        order.courier = self.couriers[1]
+        order.save()
+        self.assertCountersMatchRecount()
+
+        order.delivery_time = '14-16'
+        order.delivery_date = self.today + timedelta(days=1)
+        order.save()
+        self.assertCountersMatchRecount()
+
+    def test_cancellation_and_deletion_release_counters(self):
+        cancelled = self.make_order(status=Order.OrderStatus.PAID, courier=self.couriers[0])
+        deleted = self.make_order(status=Order.OrderStatus.ASSIGNED, courier=self.couriers[0])
+
+        cancelled.status = Order.OrderStatus.CANCELLED
+        cancelled.save()
+        self.assertCountersMatchRecount()
+
+        deleted.delete()
+        self.assertCountersMatchRecount()
+
+    def test_transitions_keep_counters(self):
+        order = self.make_order()
+        self.assertTrue(transition(order, Order.OrderStatus.ASSIGNED, courier=self.couriers[1]))
+        self.assertCountersMatchRecount()
+        self.assertTrue(transition(order, Order.OrderStatus.DELIVERED))
+        self.assertCountersMatchRecount()
+
+    def test_least_loaded_courier_is_assigned(self):
+        self.make_order(status=Order.OrderStatus.ASSIGNED, courier=self.couriers[0])
+        order = self.make_order(status=Order.OrderStatus.PAID)
+
+        self.assertEqual(assign_courier(order), self.couriers[1])
+
+
+class BulkStatusTests(CounterRecountMixin, TestCase):
+    """Массовые действия админки над заказами"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def run_action(self, action, orders):
+        return self.client.post(reverse('admin:core_order_changelist'), {
+            'action': action,
+            '_selected_action': [order.pk for order in orders],
+        })
+
+    def test_mark_paid_assigns_couriers_and_sends_digests(self):
+        orders = [self.make_order(delivery_time=time) for time in ['10-12', '10-12', '12-14']]
+
+        self.run_action('mark_paid', orders)
+
+        self.assertFalse(Order.objects.exclude(status=Order.OrderStatus.ASSIGNED).exists())
+        self.assertFalse(Order.objects.filter(courier__isnull=True).exists())
+        self.assertEqual(TelegramMessage.objects.count(), Order.objects.values('courier').distinct().count())
+        self.assertCountersMatchRecount()
+
+    def test_bulk_cancel_and_deliver_mixed_statuses(self):
+        new = self.make_order()
+        paid = self.make_order(status=Order.OrderStatus.PAID, courier=self.couriers[0])
+        assigned = self.make_order(status=Order.OrderStatus.ASSIGNED, courier=self.couriers[1], delivery_time='12-14')
+        delivered = self.make_order(status=Order.OrderStatus.ASSIGNED, courier=self.couriers[1])
+        self.assertTrue(transition(delivered, Order.OrderStatus.DELIVERED))
+
+        self.run_action('mark_delivered', [paid])
+        self.assertCountersMatchRecount()
+
+        self.run_action('mark_cancelled', [new, paid, assigned, delivered])
+
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[new.pk], Order.OrderStatus.CANCELLED)
+        self.assertEqual(statuses[paid.pk], Order.OrderStatus.DELIVERED)
+        self.assertEqual(statuses[assigned.pk], Order.OrderStatus.CANCELLED)
+        self.assertEqual(statuses[delivered.pk], Order.OrderStatus.DELIVERED)
+        self.assertCountersMatchRecount()
+
+    def test_mark_assigned_keeps_existing_couriers(self):
+        paid = self.make_order(status=Order.OrderStatus.PAID, courier=self.couriers[0])
+        new = self.make_order()
+
+        self.run_action('mark_assigned', [paid, new])
+
+        paid.refresh_from_db()
+        self.assertEqual(paid.courier, self.couriers[0])
+        self.assertEqual(Order.objects.filter(status=Order.OrderStatus.ASSIGNED).count(), 2)
+        self.assertCountersMatchRecount()
+
+
+class SalesRollupTests(CounterRecountMixin, TestCase):
+    """Дневные отчёты, которые правятся по ходу заказа, совпадают с пересборкой с нуля"""
+
+    def setUp(self):
+        super().setUp()
+        occasion = Occasion.objects.create(name='День рождения')
+        ProductOccasion.objects.create(product=self.product, occasion=occasion)
+        self.other = Product.objects.create(name='Розы', first_description='-', price=3000)
+
+    def rollups(self):
+        # Строки, обнулённые отменами, пересборка не создаёт, на сводку они не влияют
+        return {
+            model.__name__: sorted(model.objects.exclude(orders=0).values_list(*fields))
+            for model, fields in [
+                (DailyProductSales, ['date', 'product_id', 'orders', 'quantity', 'revenue']),
+                (DailyOccasionSales, ['date', 'occasion_id', 'orders', 'revenue']),
+                (DailyCourierSales, ['date', 'courier_id', 'orders', 'revenue']),
+            ]
+        }
+
+    def make_sales(self):
+        paid = self.make_order()
+        self.assertTrue(transition(paid, Order.OrderStatus.PAID))
+        assigned = self.make_order(product=self.other, quantity=2)
+        self.assertTrue(transition(assigned, Order.OrderStatus.ASSIGNED, courier=self.couriers[0]))
+        self.assertTrue(transition(assigned, Order.OrderStatus.DELIVERED))
+        moved = self.make_order(status=Order.OrderStatus.PAID, courier=self.couriers[1])
+        moved.delivery_date = self.today + timedelta(days=1)
+        moved.courier = self.couriers[0]
+        moved.save()
+        cancelled = self.make_order(status=Order.OrderStatus.PAID)
+        self.assertTrue(transition(cancelled, Order.OrderStatus.CANCELLED))
+        self.make_order()
+        self.make_order(status=Order.OrderStatus.PAID, courier=self.couriers[1]).delete()
+        bulk_set_status(Order.objects.filter(pk=paid.pk), Order.OrderStatus.CANCELLED)
+
+    def test_incremental_changes_match_rebuild(self):
+        self.make_sales()
+        incremental = self.rollups()
+        self.assertEqual(len(incremental['DailyProductSales']), 2)
+        self.assertTrue(incremental['DailyOccasionSales'])
+
+        rollups.rebuild()
+
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_migration_fills_same_rows_as_rebuild(self):
+        self.make_sales()
+        expected = self.rollups()
+        for model in (DailyProductSales, DailyOccasionSales, DailyCourierSales):
+            model.objects.all().delete()
+
+        import_module('core.migrations.0009_sales_rollups').fill_sales_rollups(django_apps, None)
+
+        self.assertEqual(self.rollups(), expected)
+
+    def test_report_requires_view_permission(self):
+        url = reverse('admin:core_dailyproductsales_changelist')
+        staff = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename='view_dailyproductsales'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class UnpaidOrderTests(CounterRecountMixin, TestCase):
+    """Брошенные неоплаченные заказы освобождают места в слотах"""
+
+    def age(self, *orders):
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+            created_at=timezone.now() - timedelta(minutes=settings.UNPAID_ORDER_MINUTES + 1)
+        )
+
+    def test_command_cancels_only_stale_new_orders(self):
+        stale = self.make_order()
+        fresh = self.make_order()
+        paid = self.make_order(status=Order.OrderStatus.PAID, courier=self.couriers[0])
+        self.age(stale, paid)
+
+        call_command('cancel_unpaid_orders', stdout=StringIO())
+
+        self.assertEqual(
+            dict(Order.objects.values_list('pk', 'status')),
+            {stale.pk: Order.OrderStatus.CANCELLED, fresh.pk: Order.OrderStatus.NEW, paid.pk: Order.OrderStatus.PAID},
+        )
+        self.assertEqual(DeliverySlot.objects.get().reserved, 2)
+        self.assertCountersMatchRecount()
+
+    def test_order_with_unprocessed_payment_is_not_cancelled(self):
+        paid_late = self.make_order()
+        abandoned = self.make_order()
+        self.age(paid_late, abandoned)
+        PaymentEvent.objects.create(
+            idempotency_key='pay:1', kind=PaymentEvent.Kind.PAY, raw_body='',
+            payload={'TransactionId': 1, 'InvoiceId': f'order-{paid_late.pk}', 'Amount': str(paid_late.total_price)},
+        )
+
+        self.assertEqual(cancel_unpaid_orders(), [abandoned.pk])
+
+        process_pending()
+        paid_late.refresh_from_db()
+        self.assertIn(paid_late.status, [Order.OrderStatus.PAID, Order.OrderStatus.ASSIGNED])
+        self.assertCountersMatchRecount()
+
+    @override_settings(DELIVERY_SLOT_CAPACITY=1)
+    def test_checkout_reclaims_slot_from_abandoned_order(self):
+        url = reverse('core:order_step_delivery', args=[self.product.pk])
+        form = {'customer_name': 'Клиент', 'customer_phone': '+79990000009', 'delivery_address': 'Адрес',
+                'delivery_time': '10-12'}
+
+        self.assertEqual(self.client.post(url, form).status_code, 302)
+        abandoned = Order.objects.get()
+        response = self.client.post(url, form)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('error', response.context)
+
+        self.age(abandoned)
+        self.assertEqual(self.client.post(url, form).status_code, 302)
+
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.status, Order.OrderStatus.CANCELLED)
+        self.assertEqual(Order.objects.filter(status=Order.OrderStatus.NEW).count(), 1)
+        self.assertEqual(DeliverySlot.objects.get().reserved, 1)
+        self.assertCountersMatchRecount()
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        roses = Product.objects.create(name='Алые розы', first_description='-', price=1000)
+        tulips = Product.objects.create(name='Тюльпаны', first_description='Весенние', price=1000)
+        fields = {'delivery_date': timezone.localdate(), 'delivery_time': '10-12'}
+        self.anna = Order.objects.create(
+            customer_name='Анна', customer_phone='+79991234567', delivery_address='Лесная, 5', product=tulips, **fields
+        )
+        self.boris = Order.objects.create(
+            customer_name='Борис', customer_phone='+79997654321', delivery_address='Садовая, 1', product=roses, **fields
+        )
+
+    def found(self, term):
+        return set(search_orders(Order.objects.all(), term))
+
+    def test_text_fields_and_product_name(self):
+        # LIKE в SQLite не сравнивает кириллицу без учёта регистра, поэтому регистр как в данных
+        self.assertEqual(self.found('Анн'), {self.anna})
+        self.assertEqual(self.found('Садовая'), {self.boris})
+        self.assertEqual(self.found('розы'), {self.boris})
+        self.assertEqual(self.found('а'), {self.anna, self.boris})
+        self.assertEqual(self.found('Весенние'), set())
+        self.assertEqual(self.found('  '), {self.anna, self.boris})
+
+    def test_full_and_partial_phone(self):
+        self.assertEqual(self.found('8 (999) 123-45-67'), {self.anna})
+        self.assertEqual(self.found('+7 999 765 43 21'), {self.boris})
+        self.assertEqual(self.found('123-45-67'), {self.anna})
+        self.assertEqual(self.found('8 999 765'), {self.boris})
+        self.assertEqual(self.found('999 12 34'), {self.anna})
+
+    def test_search_keeps_changelist_filters(self):
+        queryset = Order.objects.filter(customer_name='Борис').order_by('-id')
+        self.assertEqual(list(search_orders(queryset, 'а')), [self.boris])
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name='Букет', first_description='-', price=1000)
+        Courier.objects.create(name='Курьер', phone='+79990000000')
+        self.order = Order.objects.create(
+            customer_name='Клиент', customer_phone='+79990000001', delivery_address='Адрес',
+            delivery_date=timezone.localdate(), delivery_time='10-12', product=product,
+        )
+
+    def test_transition_only_from_read_status(self):
+        stale = Order.objects.get(pk=self.order.pk)
+
+        self.assertTrue(transition(self.order, Order.OrderStatus.CANCELLED))
+        self.assertFalse(transition(stale, Order.OrderStatus.PAID))
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.CANCELLED)
+
+    def test_courier_message_is_written_with_the_order(self):
+        courier = Courier.objects.get()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertTrue(transition(self.order, Order.OrderStatus.ASSIGNED, courier=courier))
+            self.assertEqual(TelegramMessage.objects.count(), 1)
+            raise RuntimeError
+        self.assertFalse(TelegramMessage.objects.exists())
+
+        order = Order.objects.get(pk=self.order.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(transition(order, Order.OrderStatus.ASSIGNED, courier=courier))
+        self.assertEqual(callbacks, [])
+        self.assertEqual(TelegramMessage.objects.count(), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.reads = []
+
+    def view(self, request):
+        self.reads.append(Product.objects.all().db)
+        if request.GET.get('write'):
+            Product.objects.create(name='Букет', first_description='-', price=1000)
+            self.reads.append(Product.objects.all().db)
+        return HttpResponse()
+
+    def test_get_reads_from_replica_until_write(self):
+        response = ReplicaMiddleware(self.view)(self.factory.get('/', {'write': 1}))
+
+        self.assertEqual(self.reads, ['replica', 'default'])
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_pinned_and_unsafe_requests_read_from_primary(self):
+        pinned = self.factory.get('/')
+        pinned.COOKIES[replicas.PIN_COOKIE] = '1'
+
+        for request in [pinned, self.factory.post('/')]:
+            response = ReplicaMiddleware(self.view)(request)
+            self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+        self.assertEqual(self.reads, ['default', 'default'])
+        self.assertEqual(Product.objects.all().db, 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaCacheRebuildTests(TestCase):
+    """Реплика — вторая база SQLite в памяти с теми же таблицами, до которой записи основной базы ещё не дошли.
+    Её нет в настройках, поэтому она подключается после setUpClass и разрешается только этому классу."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica'] = connections.configure_settings({
+            'default': {},
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+        })['replica']
+        cls.databases = cls.databases | {'replica'}
+        with connections['replica'].schema_editor() as editor:
+            for model in [Occasion, Flower, Product, ProductOccasion, ProductFlowerComposition]:
+                editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.databases = cls.databases - {'replica'}
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.bouquet = Product.objects.create(name='Букет', first_description='-', price=1000)
+        ProductOccasion.objects.create(product=self.bouquet, occasion=Occasion.objects.create(name='Свадьба'))
+
+    def view(self, request):
+        self.results = {
+            'replica': Product.objects.count(),
+            'quiz': pick_bouquet_id('свадьба', ''),
+            'facets': facets.get_facet_index()['all'],
+            'fragment': fragment_cache.get_or_render('count', [], Product.objects.count),
+        }
+        return HttpResponse()
+
+    def test_cache_rebuilds_read_from_primary(self):
+        ReplicaMiddleware(self.view)(RequestFactory().get('/'))
+
+        self.assertEqual(self.results, {
+            'replica': 0,
+            'quiz': self.bouquet.id,
+            'facets': {self.bouquet.id},
+            'fragment': 1,
+        })
+
+    def test_cached_bouquet_page_reads_from_primary(self):
+        response = self.client.get(reverse('core:bouquet_item', args=[self.bouquet.id]))
+
+        self.assertContains(response, 'Букет')
+
+
+@override_settings(ADMISSION_CLASSES={
+    'browse': (1, 0, 0), 'checkout': (1, 1, 5), 'payment': (1, 1, 5), 'admin': (1, 0, 0), 'export': (1, 0, 0),
+})
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = AdmissionMiddleware(lambda request: HttpResponse())
+        self.controller = self.middleware.controller
+
+    def test_requests_are_classified_by_url_name(self):
+        urls = {
+            reverse('core:catalog'): admission.BROWSE,
+            reverse('core:order_step_delivery', args=[1]): admission.CHECKOUT,
+            reverse('payments:webhook', args=['pay']): admission.PAYMENT,
+            reverse('admin:index'): admission.ADMIN,
+            reverse('admin:core_order_export'): admission.EXPORT,
+            '/missing/': admission.BROWSE,
+        }
+        for url, request_class in urls.items():
+            self.assertEqual(admission.classify(self.factory.get(url)), request_class, url)
+
+    def test_browse_is_shed_while_checkout_is_served(self):
+        self.assertTrue(self.controller.admit(admission.BROWSE))
+
+        browse = self.middleware(self.factory.get(reverse('core:catalog')))
+        checkout = self.middleware(self.factory.post(reverse('core:order_step_delivery', args=[1])))
+
+        self.assertEqual(browse.status_code, 503)
+        self.assertEqual(browse['Retry-After'], str(settings.ADMISSION_RETRY_AFTER))
+        self.assertEqual(checkout.status_code, 200)
+
+    def test_checkout_waits_in_queue_for_a_slot(self):
+        self.assertTrue(self.controller.admit(admission.CHECKOUT))
+        threading.Timer(0.05, self.controller.release, [admission.CHECKOUT]).start()
+
+        self.assertTrue(self.controller.admit(admission.CHECKOUT))
+
+    @override_settings(ADMISSION_CLASSES={
+        'browse': (5, 0, 0), 'checkout': (5, 0, 0), 'payment': (5, 0, 0), 'admin': (1, 0, 0), 'export': (1, 0, 0),
+    })
+    def test_slow_database_sheds_browse_first(self):
+        controller = admission.AdmissionController.from_settings()
+        controller.db_latency = settings.ADMISSION_DB_LATENCY_MS * 2
+
+        self.assertTrue(controller.admit(admission.BROWSE))
+        self.assertFalse(controller.admit(admission.BROWSE))
+        self.assertTrue(controller.admit(admission.CHECKOUT))
+
+    def test_streaming_response_holds_its_slot_until_closed(self):
+        middleware = AdmissionMiddleware(lambda request: StreamingHttpResponse(iter(['id;status\n', '1;new\n'])))
+        catalog = reverse('core:catalog')
+
+        response = middleware(self.factory.get(catalog))
+        self.assertEqual(middleware(self.factory.get(catalog)).status_code, 503)
+
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(middleware.controller.in_flight, 0)
+        self.assertEqual(middleware(self.factory.get(catalog)).status_code, 200)
+
+    def test_running_export_does_not_block_admin_pages(self):
+        def view(request):
+            if request.path == export:
+                return StreamingHttpResponse(iter(['id;status\n']))
+            return HttpResponse()
+
+        middleware = AdmissionMiddleware(view)
+        export = reverse('admin:core_order_export')
+
+        response = middleware(self.factory.get(export))
+
+        self.assertEqual(middleware(self.factory.get(reverse('admin:index'))).status_code, 200)
+        self.assertEqual(middleware(self.factory.get(export)).status_code, 503)
+        response.close()
+
+
+class QueryPlanTests(TestCase):
+    """Ключевые запросы админки и назначения курьеров должны идти по индексам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(products=30, orders=500, consultations=200)
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # На маленькой тестовой таблице планировщик предпочёл бы seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_status_and_delivery_filter(self):
+        orders = Order.objects.filter(
+            status=Order.OrderStatus.PAID,
+            delivery_date=timezone.now().date(),
+            delivery_time='10-12',
+        )
+        self.assertUsesIndex(orders, 'order_status_delivery_idx')
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite не применяет частичный индекс к запросу с параметрами')
+    def test_courier_active_orders_for_day(self):
+        orders = Order.objects.filter(
+            courier=Courier.objects.first(),
+            delivery_date=timezone.now().date(),
+        ).exclude(status__in=['delivered', 'cancelled'])
+        self.assertUsesIndex(orders, 'order_courier_active_idx')
+
+    def test_order_changelist_ordering(self):
+        self.assertUsesIndex(Order.objects.all()[:100], 'order_created_idx')
+
+    def test_product_customers(self):
+        orders = Order.objects.filter(product=Product.objects.first())[:100]
+        self.assertUsesIndex(orders, 'order_product_created_idx')
+
+    def test_consultations_by_status(self):
+        consultations = ConsultationRequest.objects.filter(status=ConsultationRequest.RequestStatus.NEW)[:100]
+        self.assertUsesIndex(consultations, 'consultation_status_idx')
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(products=5, orders=50, consultations=0)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+
+    def test_order_export_uses_changelist_filters(self):
+        response = self.client.get(reverse('admin:core_order_export'), {'status__exact': 'paid'})
+
+        rows = self.read_csv(response)
+        self.assertEqual(len(rows) - 1, Order.objects.filter(status='paid').count())
+
+    def test_export_starts_with_bom_for_excel(self):
+        response = self.client.get(reverse('admin:core_order_export'))
+
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith('\ufeffНомер'.encode()))
+
+    def test_formulas_in_customer_fields_are_escaped(self):
+        order = Order.objects.order_by('pk').first()
+        Order.objects.filter(pk=order.pk).update(
+            customer_name='=HYPERLINK("http://evil.example","Жми")', delivery_address='+7 cmd|calc', comment='@SUM(1)',
+        )
+
+        response = self.client.get(reverse('admin:core_order_export'))
+
+        row = next(row for row in csv.DictReader(self.read_csv(response)) if row['Номер'] == str(order.pk))
+        self.assertEqual(row['Имя клиента'], '\'=HYPERLINK("http://evil.example","Жми")')
+        self.assertEqual(row['Адрес доставки'], "'+7 cmd|calc")
+        self.assertEqual(row['Комментарий'], "'@SUM(1)")
+        self.assertEqual(row['Телефон'], str(order.customer_phone))
+
+    def test_product_customers_export(self):
+        product = Product.objects.filter(orders__isnull=False).first()
+
+        response = self.client.get(reverse('admin:core_product_customers_export', args=[product.pk]))
+
+        rows = self.read_csv(response)
+        self.assertEqual(len(rows) - 1, product.orders.count())
+        self.assertEqual(len(list(product.get_customers())), product.orders.count())
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Число запросов списка в админке не зависит от числа строк на странице"""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(products=12, couriers=6, orders=60, consultations=12)
+        florists = Florist.objects.bulk_create(
+            Florist(name=f'Флорист {number}', phone=f'+7999111{number:04d}', email=f'florist{number}@example.com')
+            for number in range(6)
+        )
+        for number, consultation in enumerate(ConsultationRequest.objects.all()):
+            ConsultationRequest.objects.filter(pk=consultation.pk).update(florist=florists[number % len(florists)])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, model, per_page):
+        model_admin = admin_site.site._registry[model]
+        url = reverse(f'admin:core_{model._meta.model_name}_changelist')
+        with mock.patch.object(model_admin, 'list_per_page', per_page), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_have_no_n_plus_one(self):
+        for model in [Product, Courier, Florist, Occasion, Order, ConsultationRequest]:
+            with self.subTest(model=model.__name__):
+                self.assertGreaterEqual(model.objects.count(), 6)
+                self.assertEqual(self.changelist_queries(model, 100), self.changelist_queries(model, 2))
+
+    def test_florist_can_be_changed_from_consultation_list(self):
+        consultation = ConsultationRequest.objects.order_by('-created_at', '-pk').first()
+        florist = Florist.objects.exclude(pk=consultation.florist_id).first()
+        url = reverse('admin:core_consultationrequest_changelist')
+        with mock.patch.object(admin_site.site._registry[ConsultationRequest], 'list_per_page', 1):
+            form = self.client.get(url).context['cl'].formset.forms[0]
+            self.assertEqual(form.instance, consultation)
+            response = self.client.post(url, {
+                'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1',
+                'form-0-id': consultation.pk, 'form-0-status': consultation.status, 'form-0-florist': florist.pk,
+                '_save': 'Сохранить',
+            })
+
+        self.assertEqual(response.status_code, 302)
+        consultation.refresh_from_db()
+        self.assertEqual(consultation.florist, florist)
+
+
+class FakeGeocoder:
+    name = 'fake'
+
+    def __init__(self, points):
+        self.points = points
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        return self.points.get(address)
+
+
+class RoutingTests(TestCase):
+    def test_long_addresses_are_stored_and_found_by_hash(self):
+        address = 'Москва, ' + 'очень длинный подъезд и код домофона ' * 50
+        geocoder = FakeGeocoder({routing.normalize_address(address): (55.7, 37.6)})
+
+        self.assertEqual(routing.geocode_addresses([address], geocoder), {address: (55.7, 37.6)})
+        self.assertEqual(routing.geocode_addresses([address.upper()], geocoder), {address.upper(): (55.7, 37.6)})
+        self.assertEqual(len(geocoder.calls), 1)
+
+        row = GeocodedAddress.objects.get()
+        row.address = 'другой адрес'
+        row.save(update_fields=['address'])
+        self.assertEqual(GeocodedAddress.objects.get().address_hash, GeocodedAddress.hash_address('другой адрес'))
+
+    def test_two_opt_removes_crossing(self):
+        matrix = routing.distance_matrix([(55.70, 37.6), (55.71, 37.6), (55.72, 37.6), (55.73, 37.6)])
+
+        self.assertEqual(routing.two_opt([0, 2, 1, 3], matrix), [0, 1, 2, 3])
+
+    def test_plan_routes_orders_stops_from_shop(self):
+        product = Product.objects.create(name='Букет', first_description='-', price=1000)
+        courier = Courier.objects.create(name='Курьер', phone='+79990000000')
+        today = timezone.localdate()
+        lat, lon = settings.SHOP_LOCATION
+        geocoder = FakeGeocoder({
+            'дальний': (lat + 0.03, lon),
+            'ближний': (lat + 0.01, lon),
+            'средний': (lat + 0.02, lon),
+        })
+        orders = Order.objects.bulk_create(
+            Order(
+                customer_name='Клиент', customer_phone='+79990000001', delivery_address=address,
+                delivery_date=today, delivery_time='10-12', product=product, total_price=1000,
+                courier=courier, status=Order.OrderStatus.PAID,
+            )
+            for address in ['Дальний', 'Ближний', 'Средний', 'Без адреса']
+        )
+
+        [manifest] = routing.plan_routes(today, geocoder)
+
+        self.assertEqual([order.delivery_address for order in manifest.stops], ['Ближний', 'Средний', 'Дальний'])
+        self.assertEqual(manifest.unlocated, [orders[3]])
+        routing.plan_routes(today, geocoder)
+        self.assertEqual(len(geocoder.calls), 4)
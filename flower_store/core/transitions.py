@@ -0,0 +1,159 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .couriers import assign_courier, change_load
+from .models import Order
+from .rollups import ROW_FIELDS, apply_changes, order_row
+from .slots import release_slot
+
+# Отправляется внутри транзакции перехода, один раз на каждый состоявшийся переход заказа: order, previous.
+# Обработчики пишут только в БД (например, в outbox TelegramMessage): запись фиксируется или откатывается
+# вместе с заказом, и сбой между коммитом заказа и уведомлением не теряет сообщение
+order_status_changed = Signal()
+
+TRANSITIONS = {
+    Order.OrderStatus.PAID: [Order.OrderStatus.NEW],
+    Order.OrderStatus.ASSIGNED: [Order.OrderStatus.NEW, Order.OrderStatus.PAID],
+    Order.OrderStatus.DELIVERED: [Order.OrderStatus.PAID, Order.OrderStatus.ASSIGNED],
+    Order.OrderStatus.CANCELLED: [Order.OrderStatus.NEW, Order.OrderStatus.PAID, Order.OrderStatus.ASSIGNED],
+}
+
+
+def _count(orders, fields, **filters):
+    rows = orders.filter(**filters).values_list(*fields).annotate(total=Count('id')).order_by()
+    return Counter({tuple(row[:-1]): row[-1] for row in rows})
+
+
+def _loads(orders):
+    return _count(
+        orders,
+        ['courier_id', 'delivery_date', 'delivery_time'],
+        courier__isnull=False,
+        status__in=Order.ACTIVE_STATUSES,
+    )
+
+
+def _slots(orders):
+    return _count(
+        orders.exclude(status=Order.OrderStatus.CANCELLED),
+        ['delivery_date', 'delivery_time'],
+    )
+
+
+def _apply_counters(before_loads, after_loads, before_slots, after_slots):
+    for key in before_loads | after_loads:
+        delta = after_loads[key] - before_loads[key]
+        if delta:
+            change_load(key, delta)
+    # Из отменённого статуса переходов нет, поэтому места в слотах только освобождаются
+    for key in before_slots:
+        delta = before_slots[key] - after_slots[key]
+        if delta > 0:
+            release_slot(*key, count=delta)
+
+
+def notify_status_changed(order, previous):
+    order_status_changed.send(sender=Order, order=order, previous=previous)
+
+
+def transition(order, status, **changes):
+    """Переводит заказ в status одним условным UPDATE ... WHERE id=... AND status=<прочитанный статус>.
+
+    changes записываются тем же UPDATE. Если заказ уже ушёл из прочитанного статуса
+    (повторный колбэк, параллельный запрос) или переход не разрешён, ничего не пишется
+    и возвращается False. Счётчики курьеров, слотов и отчёты правятся в той же транзакции,
+    в ней же отправляется order_status_changed.
+    """
+    previous = order.status
+    if previous not in TRANSITIONS[status]:
+        return False
+
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, status=previous).update(status=status, **changes)
+        if not updated:
+            return False
+
+        load_key, slot_key, sales_row = order.load_key, order.slot_key, order_row(order)
+        order.status = status
+        for field, value in changes.items():
+            setattr(order, field, value)
+
+        if load_key != order.load_key:
+            if load_key:
+                change_load(load_key, -1)
+            if order.load_key:
+                change_load(order.load_key, 1)
+        if slot_key and not order.slot_key:
+            release_slot(*slot_key)
+        apply_changes([(sales_row, order_row(order))])
+        notify_status_changed(order, previous)
+    return True
+
+
+def bulk_set_status(queryset, status):
+    """Переводит заказы в status одним UPDATE и поправляет счётчики курьеров, слотов и отчёты.
+
+    Заказы, для которых переход не разрешён (см. TRANSITIONS), пропускаются.
+    order_status_changed не отправляется: админка сама шлёт курьерам сводки.
+    Возвращает id изменённых заказов.
+    """
+    with transaction.atomic():
+        ids = list(
+            queryset.select_for_update()
+            .filter(status__in=TRANSITIONS[status])
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            return []
+
+        orders = Order.objects.filter(id__in=ids)
+        before_loads, before_slots = _loads(orders), _slots(orders)
+        sales_rows = list(orders.values(*ROW_FIELDS))
+        orders.update(status=status)
+        _apply_counters(before_loads, _loads(orders), before_slots, _slots(orders))
+        apply_changes((row, dict(row, status=status)) for row in sales_rows)
+    return ids
+
+
+def cancel_unpaid_orders(**filters):
+    """Отменяет новые заказы, не оплаченные за UNPAID_ORDER_MINUTES, и освобождает их места в слотах.
+
+    filters сужают выборку, например до одного слота. Заказы, оплата которых уже пришла, но ещё
+    ждёт process_payment_events, не отменяются. Возвращает id отменённых заказов.
+    """
+    from payments.processing import orders_with_pending_payments
+
+    cutoff = timezone.now() - timedelta(minutes=settings.UNPAID_ORDER_MINUTES)
+    return bulk_set_status(
+        Order.objects.filter(status=Order.OrderStatus.NEW, created_at__lt=cutoff, **filters)
+        .exclude(pk__in=orders_with_pending_payments()),
+        Order.OrderStatus.CANCELLED,
+    )
+
+
+def assign_couriers(ids):
+    """Назначает курьеров заказам без курьера и отмечает все заказы переданными курьеру"""
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(id__in=ids, courier__isnull=True)
+        )
+        changes = []
+        for order in orders:
+            before = order_row(order)
+            if assign_courier(order):
+                Order.objects.filter(pk=order.pk).update(courier=order.courier)
+                if order.load_key:
+                    change_load(order.load_key, 1)
+                changes.append((before, order_row(order)))
+        apply_changes(changes)
+        return bulk_set_status(
+            Order.objects.filter(id__in=ids, courier__isnull=False),
+            Order.OrderStatus.ASSIGNED,
+        )
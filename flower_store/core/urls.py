@@ -7,10 +7,12 @@ app_name = 'core'
 urlpatterns = [
     path('', views.index, name='index'),
     path('catalog/', views.catalog, name='catalog'),
+    path('catalog/more/', views.catalog_more, name='catalog_more'),
     path('result/', views.result, name='result'),
     path('bouquet/<int:bouquet_id>/', views.bouquet_item, name='bouquet_item'),
     path('consultation/', views.consultation, name='consultation'),
     path('catalog-collect/', views.catalog_collect, name='catalog_collect'),
     path('order_step_delivery/<int:bouquet_id>/', views.order_step_delivery, name='order_step_delivery'),
     path('quiz-step/', views.quiz_step, name='quiz_step'),
+    path('delivery-slots/', views.delivery_slots, name='delivery_slots'),
 ]
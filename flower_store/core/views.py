@@ -1,16 +1,22 @@
+from django.db import transaction
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 from django.utils import timezone
 
+from . import replicas
+from .facets import FACETS, FacetedSearch
 from .forms import ConsultationRequest
+from .fragment_cache import get_or_render
 from .models import Product, Order, Occasion
+from .recommendations import PRICE_RANGES, pick_bouquet_id
+from .slots import get_availability, reserve_slot
+from .transitions import cancel_unpaid_orders
 
-
-def update_session_order(request, key, value):
-    order_data = request.session.get('order_data', {})
-    order_data[key] = value
-    request.session['order_data'] = order_data
-    request.session.modified = True
+CATALOG_PAGE_SIZE = 6
+MAX_CURSOR = 2 ** 63 - 1
 
 
 def index(request):
@@ -25,33 +31,59 @@ def index(request):
     )
 
 
-def catalog(request):
-    bouquets = Product.objects.all()
+def get_catalog_page(after=None, page_size=CATALOG_PAGE_SIZE):
+    """Страница каталога после букета с id=after (keyset-пагинация по id)"""
+    bouquets = Product.objects.only('id', 'name', 'price', 'image', 'image_variants').order_by('id')
+    if after:
+        bouquets = bouquets.filter(id__gt=after)
+
+    page = list(bouquets[:page_size + 1])
+    return {
+        'bouquets': page[:page_size],
+        'next_cursor': page[page_size - 1].id if len(page) > page_size else None,
+    }
+
 
+def catalog(request):
     return render(
         request,
         'catalog.html',
         {
-            'bouquets': bouquets,
+            'page': SimpleLazyObject(get_catalog_page),
         }
     )
 
 
-def bouquet_item(request, bouquet_id):
-    bouquet = get_object_or_404(Product, id=bouquet_id)
-    composition = bouquet.flower_composition.all()
-    update_session_order(request, 'bouquet_name', bouquet.name)
-
-    if composition:
-        flower_strings = []
-        for comp in composition:
-            text = f'{comp.flower.name} - {comp.quantity} шт.'
-            flower_strings.append(text)
-        flowers_display = ', '.join(flower_strings)
-    else:
-        flowers_display = 'Состав не указан'
+def catalog_more(request):
+    # Курсор — id букета: не число или число вне диапазона bigint — ошибка клиента, а не 500 от базы
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not 0 <= after <= MAX_CURSOR:
+        return HttpResponseBadRequest()
+
+    def render_page():
+        page = get_catalog_page(after)
+        html = render_to_string(
+            'includes/bouquet-tiles.html',
+            {'bouquets': page['bouquets']},
+            request=request,
+        )
+        next_url = None
+        if page['next_cursor']:
+            next_url = f"{reverse('core:catalog_more')}?after={page['next_cursor']}"
+        return {'html': html, 'next_url': next_url}
+
+    return JsonResponse(get_or_render('catalog_more', [after], render_page))
 
-    update_session_order(request, 'bouquet_id', bouquet_id)
+
+def bouquet_item(request, bouquet_id):
+    # Букет рендерится в кэшируемый фрагмент, поэтому читается с основной базы, как и остальные фрагменты
+    with replicas.primary():
+        bouquet = get_object_or_404(Product, id=bouquet_id)
+    request.funnel.update(bouquet_name=bouquet.name, bouquet_id=bouquet_id)
+    flowers_display = bouquet.composition_display or 'Состав не указан'
 
     return render(
         request,
@@ -64,26 +96,27 @@ def bouquet_item(request, bouquet_id):
 
 
 def catalog_collect(request):
-    order_data = request.session.get('order_data', {})
-    occasion = order_data.get('order_occasion')
-    price_range = order_data.get('order_price_range')
-
-    bouquets = Product.objects.all()
-    if occasion:
-        bouquets = bouquets.filter(occasions__name__icontains=occasion)
-    if price_range:
-        if price_range == 'low':
-            bouquets = bouquets.filter(price__lte=1000)
-        elif price_range == 'medium':
-            bouquets = bouquets.filter(price__gt=1000, price__lte=5000)
-        elif price_range == 'high':
-            bouquets = bouquets.filter(price__gt=5000)
+    if 'filtered' in request.GET:
+        selected = {facet: request.GET.getlist(facet) for facet in FACETS}
+    else:
+        selected = {
+            'occasion': [request.funnel.get('order_occasion') or ''],
+            'price_range': [request.funnel.get('order_price_range') or ''],
+        }
+    # Индекс фасетов и букеты загружаются лениво, при рендере фрагмента, которого нет в кэше
+    search = FacetedSearch(selected)
+    bouquets = (
+        search.filter(Product.objects.all())
+        .only('id', 'name', 'price', 'image', 'image_variants')
+        .order_by('id')
+    )
 
     return render(
         request,
         'catalog-collect.html',
         {
             'bouquets': bouquets,
+            'search': search,
         }
     )
 
@@ -99,21 +132,59 @@ def order_step_delivery(request, bouquet_id):
             delivery_time = 'any'
 
         product = Product.objects.get(pk=bouquet_id)
-        order = Order.objects.create(
-            customer_name=customer_name,
-            customer_phone=customer_phone,
-            delivery_address=delivery_address,
-            delivery_date=timezone.now().date(),
-            delivery_time=delivery_time,
-            product=product,
-            quantity=1,
-        )
+        delivery_date = timezone.now().date()
+        with transaction.atomic():
+            reserved = reserve_slot(delivery_date, delivery_time)
+            # Слот могли занять брошенные заказы: отменяем просроченные и пробуем ещё раз
+            if not reserved and cancel_unpaid_orders(delivery_date=delivery_date, delivery_time=delivery_time):
+                reserved = reserve_slot(delivery_date, delivery_time)
+            if not reserved:
+                return render(request, 'order.html', {
+                    'bouquet_id': bouquet_id,
+                    'full_slots': get_full_slots(delivery_date),
+                    'error': 'На это время доставки мест уже нет, выберите другое.',
+                })
+
+            order = Order(
+                customer_name=customer_name,
+                customer_phone=customer_phone,
+                delivery_address=delivery_address,
+                delivery_date=delivery_date,
+                delivery_time=delivery_time,
+                product=product,
+                quantity=1,
+            )
+            order._slot_reserved = True
+            order.save()
 
         pay_url = reverse("payments:pay", args=[bouquet_id])
         amount = order.total_price
         return redirect(f"{pay_url}?order_id={order.id}&amount={amount}")
 
-    return render(request, 'order.html', {'bouquet_id': bouquet_id})
+    return render(request, 'order.html', {
+        'bouquet_id': bouquet_id,
+        'full_slots': get_full_slots(timezone.now().date()),
+    })
+
+
+def get_full_slots(delivery_date):
+    day = get_availability(delivery_date, 1)[0]
+    return [slot['value'] for slot in day['slots'] if not slot['available']]
+
+
+def delivery_slots(request):
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 31)
+    except ValueError:
+        days = 7
+
+    availability = get_availability(timezone.now().date(), days)
+    return JsonResponse({
+        'days': [
+            {'date': day['date'].isoformat(), 'slots': day['slots']}
+            for day in availability
+        ]
+    })
 
 
 def quiz_step(request):
@@ -125,7 +196,7 @@ def quiz_step(request):
         price_range = request.POST.get('price_range')
 
         if occasion and not price_range:
-            update_session_order(request, 'order_occasion', occasion)
+            request.funnel.update(order_occasion=occasion)
 
             return render(request, 'quiz-step.html', {
                 'step': 2,
@@ -135,33 +206,19 @@ def quiz_step(request):
             })
 
         if occasion and price_range:
-            bouquets = Product.objects.all()
-
-            update_session_order(request, 'order_occasion', occasion)
-            update_session_order(request, 'order_price_range', price_range)
+            request.funnel.update(order_occasion=occasion, order_price_range=price_range)
 
-            if occasion and occasion != 'any':
-                bouquets = bouquets.filter(occasions__name__icontains=occasion)
+            selected_bouquet_id = pick_bouquet_id(occasion, price_range)
 
-            if price_range:
-                if price_range == 'low':
-                    bouquets = bouquets.filter(price__lte=1000)
-                elif price_range == 'medium':
-                    bouquets = bouquets.filter(price__gt=1000, price__lte=5000)
-                elif price_range == 'high':
-                    bouquets = bouquets.filter(price__gt=5000)
-
-            selected_bouquet = bouquets.order_by('?').first()
-
-            if not selected_bouquet:
+            if not selected_bouquet_id:
                 return render(request, 'catalog.html', {
-                    'bouquets': bouquets,
+                    'page': {'bouquets': []},
                     'is_quiz_result': True,
                     'selected_occasion': occasion,
                     'selected_price': price_range
                 })
 
-            return redirect('core:bouquet_item', bouquet_id=selected_bouquet.id)
+            return redirect('core:bouquet_item', bouquet_id=selected_bouquet_id)
 
     return render(request, 'quiz-step.html', {
         'step': 1,
@@ -171,19 +228,11 @@ def quiz_step(request):
 
 
 def consultation(request):
-    order_data = request.session.get('order_data', {})
-    occasion = order_data.get('order_occasion') or 'не выбрано'
-    price_range = order_data.get('order_price_range')
-    bouquet = order_data.get('bouquet_name') or 'не выбрано'
+    occasion = request.funnel.get('order_occasion') or 'не выбрано'
+    price_range = request.funnel.get('order_price_range')
+    bouquet = request.funnel.get('bouquet_name') or 'не выбрано'
     if price_range:
-        if price_range == 'low':
-            price_range = 'До 1000'
-        elif price_range == 'medium':
-            price_range = '1000 - 5000'
-        elif price_range == 'high':
-            price_range = 'От 5000'
-        else:
-            price_range = 'Не имеет значения'
+        price_range = PRICE_RANGES.get(price_range, 'Не имеет значения')
     else:
         price_range = 'не выбрано'
 
@@ -194,11 +243,12 @@ def consultation(request):
     )
 
     if request.method == 'POST':
-        ConsultationRequest.objects.create(
-            customer_name=request.POST.get('fname'),
-            customer_phone=request.POST.get('tel'),
-            comment=comment,
-        )
+        with transaction.atomic():
+            ConsultationRequest.objects.create(
+                customer_name=request.POST.get('fname'),
+                customer_phone=request.POST.get('tel'),
+                comment=comment,
+            )
         return redirect('core:index')
     return render(request, 'consultation.html')
 
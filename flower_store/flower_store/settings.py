@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+import dj_database_url
 from environs import Env
 
 env = Env()
@@ -13,6 +14,13 @@ DEBUG = env.bool('DEBUG', False)
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
 TELEGRAM_BOT_TOKEN = env('TELEGRAM_BOT_TOKEN')
 TELEGRAM_GROUP_CHAT_ID = env('TELEGRAM_GROUP_CHAT_ID')
+TELEGRAM_API_BASE_URL = env('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')
+COURIER_SLOT_CAPACITY = env.int('COURIER_SLOT_CAPACITY', 3)
+DELIVERY_SLOT_CAPACITY = env.int('DELIVERY_SLOT_CAPACITY', 30)
+# Через сколько минут неоплаченный заказ отменяется и освобождает место в слоте доставки
+UNPAID_ORDER_MINUTES = env.int('UNPAID_ORDER_MINUTES', 60)
+CLOUDPAYMENTS_PUBLIC_ID = env('CLOUDPAYMENTS_PUBLIC_ID', 'test_api_00000000000000000000001')
+CLOUDPAYMENTS_API_SECRET = env('CLOUDPAYMENTS_API_SECRET', '')
 
 # Application definition
 
@@ -30,8 +38,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.AdmissionMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.FunnelMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -43,7 +55,7 @@ ROOT_URLCONF = 'flower_store.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.templating.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -84,6 +96,125 @@ DATABASES = {
     }
 }
 
+if env('DATABASE_URL', None):
+    DATABASES['default'] = env.dj_db_url('DATABASE_URL', conn_max_age=600, conn_health_checks=True)
+
+# Реплики только для чтения: DATABASE_REPLICA_URLS=postgres://...,postgres://...
+# Модели из DATABASE_REPLICA_APPS в GET-запросах читаются с реплик (core.replicas.ReplicaRouter),
+# после записи клиент на REPLICA_PIN_SECONDS секунд закрепляется за основной базой
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list('DATABASE_REPLICA_URLS', []), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600, conn_health_checks=True)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+DATABASE_REPLICA_APPS = env.list('DATABASE_REPLICA_APPS', ['core'])
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', 10)
+
+# Сколько запросов процесс обслуживает одновременно: у gthread-воркера — GUNICORN_THREADS,
+# у ASGI-воркера (GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker) потоков нет, поэтому 16 по умолчанию.
+# От этого числа считаются размер пула соединений и лимиты admission control.
+WORKER_THREADS = env.int('GUNICORN_THREADS', 4)
+WORKER_CLASS = env('GUNICORN_WORKER_CLASS', 'gthread' if WORKER_THREADS > 1 else 'sync')
+WORKER_CONCURRENCY = env.int('WORKER_CONCURRENCY', 16 if WORKER_CLASS.startswith('uvicorn') else WORKER_THREADS)
+
+# DB_POOL (по умолчанию включён) — пул соединений psycopg 3 в каждом процессе: всего к Postgres
+# не больше GUNICORN_WORKERS × DB_POOL_MAX_SIZE соединений, по умолчанию размер пула — WORKER_CONCURRENCY.
+# DB_POOL=false оставляет постоянные соединения (CONN_MAX_AGE) — по одному на каждый поток каждого воркера;
+# с gthread-воркерами gunicorn этот режим не использовать, соединений станет workers × threads и больше.
+# DB_PGBOUNCER — работа через PgBouncer в режиме transaction pooling: без серверных курсоров
+# и подготовленных запросов, которые живут дольше одной транзакции.
+DB_POOL = env.bool('DB_POOL', True)
+DB_PGBOUNCER = env.bool('DB_PGBOUNCER', False)
+
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        continue
+    options = database.setdefault('OPTIONS', {})
+    if DB_POOL:
+        database['CONN_MAX_AGE'] = 0
+        options['pool'] = {
+            'min_size': env.int('DB_POOL_MIN_SIZE', 1),
+            'max_size': env.int('DB_POOL_MAX_SIZE', WORKER_CONCURRENCY),
+            'timeout': env.float('DB_POOL_TIMEOUT', 10),
+            'max_idle': env.float('DB_POOL_MAX_IDLE', 300),
+        }
+    if DB_PGBOUNCER:
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+        options['prepare_threshold'] = None
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Версии индекса квиза и фрагментов каталога хранятся в кэше, поэтому он должен быть общим для всех
+# воркеров (проверка core.E001): файловый в общем каталоге или
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache и CACHE_LOCATION=redis://...
+
+CACHES = {
+    'default': {
+        'BACKEND': env('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': env('CACHE_LOCATION', '/var/tmp/flower_store'),
+    }
+}
+
+# Тесты получают свой кэш во временном каталоге и не очищают общий
+TEST_RUNNER = 'core.testing.TestRunner'
+
+CATALOG_CACHE_FRESH = env.int('CATALOG_CACHE_FRESH', 300)
+CATALOG_CACHE_STALE = env.int('CATALOG_CACHE_STALE', 60 * 60 * 24)
+
+# Где хранить выбор покупателя в воронке: 'session' или 'cookie' (подписанная cookie, без записи в БД)
+FUNNEL_STORAGE = env('FUNNEL_STORAGE', 'session')
+
+# Метрики запросов (core.middleware.RequestMetricsMiddleware)
+SERVER_TIMING = env.bool('SERVER_TIMING', True)
+# Сколько одинаковых SQL за запрос считать признаком N+1
+REQUEST_METRICS_N_PLUS_ONE = env.int('REQUEST_METRICS_N_PLUS_ONE', 5)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.metrics': {
+            'handlers': ['console'],
+            'level': env('REQUEST_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Admission control (core.middleware.AdmissionMiddleware), лимиты на один процесс.
+# Класс запроса определяется по имени URL (core.admission.ROUTES). Для каждого класса:
+# (одновременных запросов, мест в очереди, секунд ожидания в очереди).
+# По умолчанию витрине достаётся на один запрос меньше, чем процесс обслуживает одновременно
+# (WORKER_CONCURRENCY), поэтому оформлению и оплате всегда остаётся свободное место.
+ADMISSION_CONTROL = env.bool('ADMISSION_CONTROL', True)
+ADMISSION_CLASSES = {
+    'browse': (env.int('ADMISSION_BROWSE_LIMIT', max(WORKER_CONCURRENCY - 1, 1)), 0, 0),
+    'checkout': (env.int('ADMISSION_CHECKOUT_LIMIT', WORKER_CONCURRENCY), 20, 5),
+    'payment': (env.int('ADMISSION_PAYMENT_LIMIT', WORKER_CONCURRENCY), 50, 10),
+    'admin': (env.int('ADMISSION_ADMIN_LIMIT', 4), 5, 10),
+    'export': (env.int('ADMISSION_EXPORT_LIMIT', 1), 2, 10),
+}
+# Витрина отклоняется сразу, если в процессе уже столько запросов или средний запрос к БД дольше порога
+ADMISSION_MAX_IN_FLIGHT = env.int('ADMISSION_MAX_IN_FLIGHT', WORKER_CONCURRENCY)
+ADMISSION_DB_LATENCY_MS = env.float('ADMISSION_DB_LATENCY_MS', 50)
+ADMISSION_RETRY_AFTER = env.int('ADMISSION_RETRY_AFTER', 5)
+
+# Маршруты курьеров (команда plan_routes)
+# GEOCODER: core.routing.OfflineGeocoder берёт координаты только из таблицы адресов,
+# core.routing.NominatimGeocoder дополнительно спрашивает GEOCODER_URL (OpenStreetMap Nominatim)
+GEOCODER = env('GEOCODER', 'core.routing.OfflineGeocoder')
+GEOCODER_URL = env('GEOCODER_URL', 'https://nominatim.openstreetmap.org/search')
+SHOP_LOCATION = tuple(env.list('SHOP_LOCATION', [55.7558, 37.6173], subcast=float))
+COURIER_SPEED_KMH = env.float('COURIER_SPEED_KMH', 20)
+DELIVERY_STOP_MINUTES = env.int('DELIVERY_STOP_MINUTES', 10)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
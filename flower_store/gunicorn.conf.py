@@ -0,0 +1,48 @@
+"""Профиль gunicorn для продакшена, запускается из каталога с manage.py: gunicorn -c gunicorn.conf.py
+
+Любой параметр можно переопределить переменной окружения GUNICORN_* или ключом командной строки.
+"""
+import multiprocessing
+import os
+
+from environs import Env
+
+env = Env()
+env.read_env()
+
+cpu_count = multiprocessing.cpu_count()
+
+wsgi_app = 'flower_store.wsgi:application'
+bind = env('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Запрос витрины почти всё время ждёт БД или клиента, поэтому в каждом процессе несколько потоков.
+# Соединения с БД берутся из пула процесса (DB_POOL, размер по умолчанию — threads); постоянные
+# соединения (DB_POOL=false) с gthread не использовать: каждый поток держит своё
+workers = env.int('GUNICORN_WORKERS', cpu_count * 2 + 1)
+threads = env.int('GUNICORN_THREADS', 4)
+worker_class = env('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+# Django импортируется один раз в мастере, воркеры получают готовый код через fork
+preload_app = env.bool('GUNICORN_PRELOAD', True)
+
+# Плановая замена воркеров: после max_requests (с разбросом, чтобы не все разом) воркер
+# дообслуживает начатые запросы и уступает место новому
+max_requests = env.int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = env.int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+timeout = env.int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env.int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = env.int('GUNICORN_KEEPALIVE', 5)
+
+# Пульс воркеров в памяти, а не на диске контейнера
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def pre_fork(server, worker):
+    """Соединения и пулы, которые мастер мог открыть при preload_app, не должны достаться воркерам"""
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
@@ -1,3 +1,14 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import PaymentEvent
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'idempotency_key', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['kind', 'status', 'received_at']
+    search_fields = ['idempotency_key', 'raw_body']
+    readonly_fields = [
+        'idempotency_key', 'kind', 'payload', 'raw_body', 'attempts',
+        'last_error', 'received_at', 'processed_at',
+    ]
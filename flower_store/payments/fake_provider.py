@@ -0,0 +1,34 @@
+import uuid
+from urllib.parse import urlencode
+
+from django.test import Client
+
+from .webhooks import SIGNATURE_HEADER, sign
+
+
+class FakeProvider:
+    """Локальная замена CloudPayments: собирает и подписывает уведомления и повторяет их,
+    как это делает провайдер при таймаутах и ошибках."""
+
+    def __init__(self, secret):
+        self.secret = secret
+
+    def notification(self, order, transaction_id=None, amount=None):
+        return {
+            'TransactionId': transaction_id or str(uuid.uuid4().int % 10 ** 9),
+            'Amount': str(order.total_price if amount is None else amount),
+            'Currency': 'RUB',
+            'InvoiceId': f'order-{order.pk}',
+            'AccountId': order.customer_email or str(order.customer_phone),
+            'Status': 'Completed',
+            'TestMode': '1',
+        }
+
+    def send(self, client, url, payload, signature=None):
+        """Отправляет уведомление через тестовый Client Django или requests.Session"""
+        body = urlencode(payload).encode()
+        headers = {SIGNATURE_HEADER: signature or sign(body, self.secret)}
+        content_type = 'application/x-www-form-urlencoded'
+        if isinstance(client, Client):
+            return client.post(url, body, content_type=content_type, headers=headers)
+        return client.post(url, data=body, headers={**headers, 'Content-Type': content_type}, timeout=10)
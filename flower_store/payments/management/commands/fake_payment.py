@@ -0,0 +1,33 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from core.models import Order
+from payments.fake_provider import FakeProvider
+
+
+class Command(BaseCommand):
+    help = 'Отправляет на сайт подписанное уведомление об оплате заказа, как CloudPayments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('order_id', type=int)
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес сайта')
+        parser.add_argument('--kind', default='pay', choices=['pay', 'fail'])
+        parser.add_argument('--transaction-id', help='По умолчанию случайный')
+        parser.add_argument('--repeat', type=int, default=1, help='Сколько раз повторить то же уведомление')
+
+    def handle(self, *args, **options):
+        if not settings.CLOUDPAYMENTS_API_SECRET:
+            raise CommandError('Задайте CLOUDPAYMENTS_API_SECRET: без него сайт отклоняет уведомления')
+        order = Order.objects.filter(pk=options['order_id']).first()
+        if not order:
+            raise CommandError(f"Заказ #{options['order_id']} не найден")
+
+        provider = FakeProvider(settings.CLOUDPAYMENTS_API_SECRET)
+        payload = provider.notification(order, options['transaction_id'])
+        url = options['url'].rstrip('/') + reverse('payments:webhook', args=[options['kind']])
+        with requests.Session() as session:
+            for _ in range(options['repeat']):
+                response = provider.send(session, url, payload)
+                self.stdout.write(f'{response.status_code} {response.text}')
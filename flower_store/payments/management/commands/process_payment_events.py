@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.processing import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Применяет к заказам сохранённые уведомления об оплате'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между опросами пустой очереди, сек.')
+        parser.add_argument('--once', action='store_true', help='Обработать текущую очередь и выйти')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                stats = process_pending(options['batch_size'])
+                if stats:
+                    self.stdout.write(' '.join(f'{status}={count}' for status, count in sorted(stats.items())))
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=100, unique=True, verbose_name='Ключ идемпотентности')),
+                ('kind', models.CharField(choices=[('pay', 'Оплата'), ('fail', 'Отказ')], max_length=20, verbose_name='Тип уведомления')),
+                ('payload', models.JSONField(verbose_name='Данные уведомления')),
+                ('raw_body', models.TextField(verbose_name='Тело запроса')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('applied', 'Применено'), ('ignored', 'Без изменений'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток обработки')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Получено')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+            ],
+            options={
+                'verbose_name': 'Уведомление об оплате',
+                'verbose_name_plural': 'Уведомления об оплате',
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='payment_event_pending_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,69 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class PaymentEvent(models.Model):
+    class Kind(models.TextChoices):
+        PAY = 'pay', 'Оплата'
+        FAIL = 'fail', 'Отказ'
+
+    class EventStatus(models.TextChoices):
+        PENDING = 'pending', 'Ожидает обработки'
+        APPLIED = 'applied', 'Применено'
+        IGNORED = 'ignored', 'Без изменений'
+        FAILED = 'failed', 'Ошибка'
+
+    idempotency_key = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Ключ идемпотентности'
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=Kind.choices,
+        verbose_name='Тип уведомления'
+    )
+    payload = models.JSONField(
+        verbose_name='Данные уведомления'
+    )
+    raw_body = models.TextField(
+        verbose_name='Тело запроса'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=EventStatus.choices,
+        default=EventStatus.PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Попыток обработки'
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Следующая попытка'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+    received_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Получено'
+    )
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Обработано'
+    )
+
+    class Meta:
+        verbose_name = 'Уведомление об оплате'
+        verbose_name_plural = 'Уведомления об оплате'
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='payment_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.idempotency_key} ({self.status})'
@@ -0,0 +1,123 @@
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.couriers import assign_courier
+from core.models import Order
+from core.transitions import transition
+
+from .models import PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+MAX_BACKOFF = 300
+INVOICE_PREFIX = 'order-'
+
+
+class PaymentError(Exception):
+    """Уведомление нельзя применить, повтор не поможет"""
+
+
+def confirm_payment(order):
+    """Оплачивает заказ и сразу передаёт его курьеру одной записью в заказ.
+
+    Возвращает False, если заказ уже не новый (повторное уведомление).
+    """
+    if order.status != Order.OrderStatus.NEW:
+        return False
+    with transaction.atomic():
+        courier = order.courier or assign_courier(order)
+        if courier:
+            return transition(order, Order.OrderStatus.ASSIGNED, courier=courier)
+        return transition(order, Order.OrderStatus.PAID)
+
+
+def parse_invoice(payload):
+    """id заказа из InvoiceId вида order-<id> или None"""
+    invoice = str(payload.get('InvoiceId', '')) if isinstance(payload, dict) else ''
+    if not invoice.startswith(INVOICE_PREFIX) or not invoice[len(INVOICE_PREFIX):].isdigit():
+        return None
+    return int(invoice[len(INVOICE_PREFIX):])
+
+
+def get_order(payload):
+    order_id = parse_invoice(payload)
+    if order_id is None:
+        raise PaymentError(f"Неизвестный InvoiceId: {payload.get('InvoiceId', '')!r}")
+    order = Order.objects.select_related('product', 'courier').filter(pk=order_id).first()
+    if not order:
+        raise PaymentError(f'Заказ {INVOICE_PREFIX}{order_id} не найден')
+    return order
+
+
+def orders_with_pending_payments():
+    """id заказов, уведомление об оплате которых уже принято, но ещё не обработано"""
+    payloads = (
+        PaymentEvent.objects
+        .filter(kind=PaymentEvent.Kind.PAY, status=PaymentEvent.EventStatus.PENDING)
+        .values_list('payload', flat=True)
+    )
+    return {order_id for order_id in map(parse_invoice, payloads) if order_id is not None}
+
+
+def apply_event(event):
+    """Применяет уведомление; возвращает итоговый статус события"""
+    if event.kind != PaymentEvent.Kind.PAY:
+        return PaymentEvent.EventStatus.IGNORED
+
+    order = get_order(event.payload)
+    try:
+        amount = Decimal(str(event.payload.get('Amount')))
+    except InvalidOperation:
+        raise PaymentError(f"Некорректная сумма: {event.payload.get('Amount')!r}")
+    if amount != order.total_price:
+        raise PaymentError(f'Сумма {amount} не совпадает со стоимостью заказа {order.total_price}')
+    if order.status == Order.OrderStatus.CANCELLED:
+        # Например, заказ отменён как неоплаченный (cancel_unpaid_orders): деньги нужно вернуть вручную
+        raise PaymentError(f'Оплачен отменённый заказ {order.pk}')
+
+    if confirm_payment(order):
+        return PaymentEvent.EventStatus.APPLIED
+    return PaymentEvent.EventStatus.IGNORED
+
+
+def process_pending(batch_size=50):
+    """Обрабатывает очередь уведомлений; несколько воркеров не берут одно событие дважды.
+
+    Возвращает число событий по итоговым статусам.
+    """
+    stats = {}
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=PaymentEvent.EventStatus.PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        for event in events:
+            now = timezone.now()
+            try:
+                with transaction.atomic():
+                    event.status = apply_event(event)
+            except PaymentError as e:
+                event.status = PaymentEvent.EventStatus.FAILED
+                event.last_error = str(e)
+            except Exception as e:
+                logger.exception('Не удалось обработать уведомление %s', event.idempotency_key)
+                event.attempts += 1
+                event.last_error = repr(e)
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = PaymentEvent.EventStatus.FAILED
+                else:
+                    event.next_attempt_at = now + timedelta(seconds=min(2 ** event.attempts, MAX_BACKOFF))
+            if event.status != PaymentEvent.EventStatus.PENDING:
+                event.processed_at = now
+            stats[event.status] = stats.get(event.status, 0) + 1
+
+        PaymentEvent.objects.bulk_update(
+            events, ['status', 'attempts', 'next_attempt_at', 'last_error', 'processed_at']
+        )
+    return stats
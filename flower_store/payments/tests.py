@@ -1,3 +1,92 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from bot.models import TelegramMessage
+from core.models import Courier, CourierLoad, Order, Product
+
+from .fake_provider import FakeProvider
+from .models import PaymentEvent
+from .processing import apply_event, process_pending
+from .webhooks import SIGNATURE_HEADER, sign
+
+SECRET = 'test-secret'
+
+
+@override_settings(CLOUDPAYMENTS_API_SECRET=SECRET)
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name='Букет', first_description='-', price=1500)
+        Courier.objects.create(name='Курьер', phone='+79990000000')
+        self.order = Order.objects.create(
+            customer_name='Клиент', customer_phone='+79990000001', delivery_address='Адрес',
+            delivery_date=timezone.localdate(), delivery_time='10-12', product=product,
+        )
+        self.provider = FakeProvider(SECRET)
+        self.url = reverse('payments:webhook', args=['pay'])
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return process_pending()
+
+    def test_replayed_notification_is_stored_once_and_applied_once(self):
+        payload = self.provider.notification(self.order)
+        for _ in range(3):
+            response = self.provider.send(self.client, self.url, payload)
+            self.assertEqual(response.json(), {'code': 0})
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.NEW)
+
+        self.assertEqual(self.process(), {'applied': 1})
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.ASSIGNED)
+        self.assertEqual(TelegramMessage.objects.count(), 1)
+
+    def test_repeated_payment_callback_is_noop(self):
+        self.provider.send(self.client, self.url, self.provider.notification(self.order))
+        self.process()
+
+        # Повтор с новым TransactionId: заказ читается один раз и больше ничего не пишется
+        self.provider.send(self.client, self.url, self.provider.notification(self.order))
+        event = PaymentEvent.objects.get(status=PaymentEvent.EventStatus.PENDING)
+        with self.assertNumQueries(1):
+            self.assertEqual(apply_event(event), PaymentEvent.EventStatus.IGNORED)
+        self.assertEqual(self.process(), {'ignored': 1})
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.ASSIGNED)
+        self.assertEqual(TelegramMessage.objects.count(), 1)
+        self.assertEqual(CourierLoad.objects.get().orders, 1)
+
+    def test_malformed_json_is_rejected(self):
+        for body in [b'{not json', b'[1, 2]', b'"text"', b'\xff']:
+            with self.subTest(body=body):
+                response = self.client.post(
+                    self.url, body, content_type='application/json',
+                    headers={SIGNATURE_HEADER: sign(body, SECRET)},
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_bad_signature_is_rejected(self):
+        response = self.provider.send(self.client, self.url, self.provider.notification(self.order), signature='bad')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_amount_mismatch_fails_event(self):
+        self.provider.send(self.client, self.url, self.provider.notification(self.order, amount='1.00'))
+
+        self.assertEqual(self.process(), {'failed': 1})
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.NEW)
+
+    def test_payment_for_cancelled_order_fails_event(self):
+        Order.objects.filter(pk=self.order.pk).update(status=Order.OrderStatus.CANCELLED)
+        self.provider.send(self.client, self.url, self.provider.notification(self.order))
+
+        self.assertEqual(self.process(), {'failed': 1})
+        self.assertIn('отменённый', PaymentEvent.objects.get().last_error)
+
+    def test_success_redirect_does_not_confirm_payment(self):
+        self.client.get(reverse('payments:success'), {'order_id': self.order.pk})
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.NEW)
@@ -8,4 +8,5 @@ urlpatterns = [
     path("pay/<int:bouquet_id>/", views.pay, name="pay"),
     path("success/", views.success, name="success"),
     path("fail/", views.fail, name="fail"),
+    path("webhook/<slug:kind>/", views.webhook, name="webhook"),
 ]
@@ -1,6 +1,11 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
-from core.models import Order, Courier
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .models import PaymentEvent
+from .webhooks import SIGNATURE_HEADER, parse_payload, verify_signature
 
 
 def pay(request, bouquet_id: int):
@@ -10,30 +15,47 @@ def pay(request, bouquet_id: int):
         "bouquet_id": bouquet_id,
         "amount": amount,
         "order_id": order_id,
-        "PUBLIC_ID": "test_api_00000000000000000000001",
+        "PUBLIC_ID": settings.CLOUDPAYMENTS_PUBLIC_ID,
     }
     return render(request, "order-step.html", ctx)
 
 
 def success(request):
-    order_id = request.GET.get("order_id")
-
-    order = Order.objects.get(pk=order_id)
-    order.status = Order.OrderStatus.PAID
-
-    if not order.courier:
-        from django.db.models import Count
-        free_courier = Courier.objects.annotate(
-            order_count=Count('orders')
-        ).order_by('order_count').first()
-        
-        if free_courier:
-            order.courier = free_courier
-
-    order.save()
-
+    # Оплату подтверждает уведомление провайдера (webhook), а не переход браузера
     return redirect('core:index')
 
 
 def fail(request):
     return HttpResponse("Оплата отклонена")
+
+
+@csrf_exempt
+@require_POST
+def webhook(request, kind):
+    """Принимает уведомление CloudPayments: проверяет подпись, сохраняет и сразу отвечает.
+
+    Заказ меняет команда process_payment_events. Повтор того же уведомления
+    (тот же TransactionId) не создаёт второго события.
+    """
+    if kind not in PaymentEvent.Kind.values:
+        raise Http404
+    if not verify_signature(request.body, request.headers.get(SIGNATURE_HEADER, '')):
+        return HttpResponseForbidden()
+
+    payload = parse_payload(request)
+    transaction_id = payload and payload.get('TransactionId')
+    if not transaction_id:
+        return HttpResponseBadRequest()
+
+    PaymentEvent.objects.bulk_create(
+        [
+            PaymentEvent(
+                idempotency_key=f'{kind}:{transaction_id}',
+                kind=kind,
+                payload=payload,
+                raw_body=request.body.decode('utf-8', 'replace'),
+            )
+        ],
+        ignore_conflicts=True,
+    )
+    return JsonResponse({'code': 0})
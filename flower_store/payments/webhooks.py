@@ -0,0 +1,32 @@
+import base64
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+
+SIGNATURE_HEADER = 'Content-HMAC'
+
+
+def sign(body: bytes, secret: str) -> str:
+    """Подпись уведомления CloudPayments: base64(HMAC-SHA256(тело запроса, API secret))"""
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_signature(body: bytes, signature: str) -> bool:
+    secret = settings.CLOUDPAYMENTS_API_SECRET
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign(body, secret), signature)
+
+
+def parse_payload(request) -> dict | None:
+    """CloudPayments присылает form-urlencoded, по настройке — JSON; None, если тело не разобрать"""
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return None
+        return payload if isinstance(payload, dict) else None
+    return request.POST.dict()
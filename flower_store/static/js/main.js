@@ -42,8 +42,35 @@ function checkButtonVisibility() {
   }
 }
 
-// Вешаем обработчик события на кнопку
-showMoreButton.addEventListener('click', showMoreItems);
+// Функция для подгрузки следующей страницы каталога с сервера
+function loadMoreItems() {
+  showMoreButton.disabled = true;
 
-// Вызываем функцию при загрузке страницы, чтобы скрыть лишние элементы
-hideBoxesOnLoad();
\ No newline at end of file
+  fetch(showMoreButton.dataset.moreUrl, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+    .then(response => response.json())
+    .then(data => {
+      // Новые букеты вставляем перед кнопкой, чтобы она оставалась в конце списка
+      showMoreButton.insertAdjacentHTML('beforebegin', data.html);
+
+      if (data.next_url) {
+        showMoreButton.dataset.moreUrl = data.next_url;
+        showMoreButton.disabled = false;
+      } else {
+        showMoreButton.style.display = 'none';
+      }
+    })
+    .catch(() => {
+      showMoreButton.disabled = false;
+    });
+}
+
+if (showMoreButton && showMoreButton.dataset.moreUrl) {
+  // Каталог отдаётся страницами: следующие букеты запрашиваем по курсору
+  showMoreButton.addEventListener('click', loadMoreItems);
+} else if (showMoreButton) {
+  // Вешаем обработчик события на кнопку
+  showMoreButton.addEventListener('click', showMoreItems);
+
+  // Вызываем функцию при загрузке страницы, чтобы скрыть лишние элементы
+  hideBoxesOnLoad();
+}
\ No newline at end of file